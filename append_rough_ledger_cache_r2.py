@@ -19,40 +19,100 @@ Cloudflare R2 対応版:
   python append_rough_ledger_cache.py ledger_cache_2025.json 2025-01-01 2025-12-31
 """
 
+import asyncio
+import gzip
+import hashlib
 import json
 import os
 import re
 import sys
+import threading
 import time
+import weakref
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from io import BytesIO
 
 import boto3
+import httpx
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
+from xrpl.asyncio.clients import AsyncJsonRpcClient
+from xrpl.asyncio.clients.exceptions import XRPLRequestFailureException
+from xrpl.asyncio.clients.utils import json_to_response, request_to_json_rpc
 from xrpl.clients import JsonRpcClient
 from xrpl.models.requests import Ledger
+from xrpl.models.response import Response
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準 json で代替
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstd を使わなければ不要
+    zstandard = None
+
+try:
+    import h2  # noqa: F401  httpx で HTTP/2 を使うのに必要
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
 # ====== 環境設定 ======
 GENESIS_INDEX = 32570
 RIPPLE_EPOCH = 946684800  # 2000-01-01T00:00:00Z
 JSON_RPC_URL = "https://xrplcluster.com/"
-client = JsonRpcClient(JSON_RPC_URL)
+XRPL_TIMEOUT = 30.0
+XRPL_MAX_CONNECTIONS = 16  # 使い回す接続数の上限
+LATEST_LEDGER_TTL = 30.0  # 最新 validated レジャーを使い回す秒数
+XRPL_RATE_PER_SEC = 20.0  # 1秒あたりの最大リクエスト数（レート制限対策）
+XRPL_BURST = 40  # 続けて投げてよいリクエスト数
 
 # ====== R2設定 ======
 R2_ACCOUNT_ID = os.environ.get("R2_ACCOUNT_ID", "")
 R2_ACCESS_KEY_ID = os.environ.get("R2_ACCESS_KEY_ID", "")
 R2_SECRET_ACCESS_KEY = os.environ.get("R2_SECRET_ACCESS_KEY", "")
 R2_BUCKET_NAME = os.environ.get("R2_BUCKET_NAME", "")
+# これを超えるサイズはマルチパート（並列）アップロードにする
+R2_MULTIPART_THRESHOLD = 8 * 1024 ** 2
+# R2 に置く JSON の圧縮方式（gzip / zstd / identity）。gzip ならブラウザ等でもそのまま展開される
+R2_CONTENT_ENCODING = os.environ.get("R2_CONTENT_ENCODING", "gzip")
+# 他の実行と書き込みが競合したときに、取り込み直して保存し直す回数
+R2_SAVE_MAX_RETRIES = 3
+
+# ====== JSON 出力設定 ======
+# 既定はコンパクト出力。デバッグ用に人が読める形にしたい場合は PRETTY_JSON=1 を設定する
+PRETTY_JSON = bool(os.environ.get("PRETTY_JSON"))
+_JSON_FORMAT = {"indent": 2} if PRETTY_JSON else {"separators": (",", ":")}
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    if PRETTY_JSON:
+        _ORJSON_OPTIONS |= orjson.OPT_INDENT_2
+
+_R2_CLIENT = None
+# load_cache で読んだ時点の ETag（キーごと。存在しなかったキーは None）。
+# save_cache はこれを条件（If-Match / If-None-Match）にして上書きする
+_LOADED_ETAGS: dict[str, str | None] = {}
+
 
 def get_r2_client():
-    """R2用のboto3クライアントを取得"""
+    """R2用のboto3クライアントを取得（生成は初回のみで、以降は使い回す）"""
+    global _R2_CLIENT
+    if _R2_CLIENT is not None:
+        return _R2_CLIENT
+
     if not all([R2_ACCOUNT_ID, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY]):
         raise ValueError(
             "R2の認証情報が設定されていません。\n"
             "環境変数 R2_ACCOUNT_ID, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY を設定してください。"
         )
     
-    return boto3.client(
+    _R2_CLIENT = boto3.client(
         "s3",
         endpoint_url=f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com",
         aws_access_key_id=R2_ACCESS_KEY_ID,
@@ -60,9 +120,115 @@ def get_r2_client():
         config=Config(
             signature_version="s3v4",
             retries={"max_attempts": 3, "mode": "standard"},
+            max_pool_connections=32,
         ),
         region_name="auto",
     )
+    return _R2_CLIENT
+
+
+class RateLimiter:
+    """
+    トークンバケット型のレート制限。
+    トークンが尽きたときだけ待つので、サーバーに余裕がある間はまとめて投げられる。
+    reserve() が待ち秒数を返すので、スレッドからも asyncio からも使える。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """トークンを1つ予約し、それが使えるようになるまでの待ち秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+
+xrpl_limiter = RateLimiter(XRPL_RATE_PER_SEC, burst=XRPL_BURST)
+
+
+def xrpl_request(request):
+    """レート制限を掛けて client.request を呼ぶ"""
+    xrpl_limiter.acquire()
+    return client.request(request)
+
+
+def decode_rpc_response(response: httpx.Response) -> Response:
+    """JSON-RPC のレスポンスを xrpl-py の Response にする（orjson があれば使う）"""
+    try:
+        data = orjson.loads(response.content) if orjson is not None else response.json()
+    except ValueError:
+        raise XRPLRequestFailureException({
+            "error": response.status_code,
+            "error_message": response.text,
+        })
+    return json_to_response(data)
+
+
+class PooledJsonRpcClient(JsonRpcClient):
+    """
+    接続を使い回す JsonRpcClient。
+    xrpl-py 標準のクライアントは request ごとに HTTP クライアントを作り直す（毎回 TLS ハンドシェイク）ので、
+    1つの httpx.Client を持ち続けて keep-alive（h2 があれば HTTP/2）で投げる。スレッドから同時に使ってよい。
+    """
+
+    def __init__(self, url: str):
+        super().__init__(url)
+        self._http = httpx.Client(
+            http2=_HTTP2,
+            timeout=XRPL_TIMEOUT,
+            limits=httpx.Limits(max_connections=XRPL_MAX_CONNECTIONS),
+        )
+
+    def request(self, request) -> Response:
+        response = self._http.post(self.url, json=request_to_json_rpc(request))
+        return decode_rpc_response(response)
+
+
+class PooledAsyncJsonRpcClient(AsyncJsonRpcClient):
+    """
+    接続を使い回す AsyncJsonRpcClient。
+    httpx.AsyncClient はイベントループをまたいで使えないので、ループごとに1つ持つ
+    （別スレッドの asyncio.run から同じインスタンスを使ってもよい）。
+    使い終わったら、そのループの中で aclose() を呼ぶ。
+    """
+
+    def __init__(self, url: str):
+        super().__init__(url)
+        self._http: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _client_for_loop(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if loop not in self._http:
+            self._http[loop] = httpx.AsyncClient(
+                http2=_HTTP2,
+                timeout=XRPL_TIMEOUT,
+                limits=httpx.Limits(max_connections=XRPL_MAX_CONNECTIONS),
+            )
+        return self._http[loop]
+
+    async def _request_impl(self, request, *, timeout: float = XRPL_TIMEOUT) -> Response:
+        response = await self._client_for_loop().post(self.url, json=request_to_json_rpc(request))
+        return decode_rpc_response(response)
+
+    async def aclose(self) -> None:
+        """実行中のループ用の HTTP クライアントを閉じる"""
+        http = self._http.pop(asyncio.get_running_loop(), None)
+        if http is not None:
+            await http.aclose()
+
+
+client = PooledJsonRpcClient(JSON_RPC_URL)
 
 
 class FutureLedgerError(Exception):
@@ -75,17 +241,82 @@ def ripple_time_to_datetime(ripple_time: int) -> datetime:
     return datetime.fromtimestamp(ripple_time + RIPPLE_EPOCH, tz=timezone.utc)
 
 
+_YEAR_RE = re.compile(r"(\d{4})")
+
+
+def _is_ymd(k: str) -> bool:
+    """k が YYYY-MM-DD 形式か（旧フォーマットの移行で全キーに使うので、正規表現を使わずに判定する）"""
+    return (
+        len(k) == 10 and k[4] == "-" and k[7] == "-"
+        and k[:4].isdigit() and k[5:7].isdigit() and k[8:].isdigit()
+    )
+
+
+@lru_cache(maxsize=128)
 def infer_year_from_path(path: str) -> int | None:
     """
     ファイルパスから 4桁の年を推測 (例: ledger_cache_2025.json → 2025)。
     見つからなければ None。
     """
-    m = re.search(r"(\d{4})", os.path.basename(path))
+    m = _YEAR_RE.search(os.path.basename(path))
     if m:
         return int(m.group(1))
     return None
 
 
+def date_key_of(dt: datetime) -> str:
+    """daily のキー（2025-01-01 形式）。strftime より速いので f-string で組み立てる"""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+
+
+@dataclass(slots=True)
+class DailyEntry:
+    """
+    daily の1件。探索中に何度も参照するので、int 変換は読み込み時の1回だけにする。
+    精緻化で使うのは ledger_index だけなので、close_time は欠けていてもよい
+    """
+    ledger_index: int
+    close_time: str | None
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "DailyEntry":
+        return cls(int(d["ledger_index"]), d.get("close_time"))
+
+    def to_dict(self) -> dict:
+        d = {"ledger_index": self.ledger_index}
+        if self.close_time is not None:
+            d["close_time"] = self.close_time
+        return d
+
+
+@dataclass(slots=True)
+class HourlyEntry:
+    """
+    hourly の1件。precision は補間で埋めたもの（generate_hourly_clio.py --interpolate）だけ "interpolated"。
+    補間値には実際の close_time がないので、close_time は None のことがある
+    """
+    ledger_index: int
+    close_time: str | None
+    precision: str | None = None
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "HourlyEntry":
+        return cls(int(d["ledger_index"]), d.get("close_time"), d.get("precision"))
+
+    @property
+    def interpolated(self) -> bool:
+        """推定値か（確定したレジャーではないので、探索の範囲には使わない）"""
+        return self.precision == "interpolated"
+
+    def to_dict(self) -> dict:
+        d = {"ledger_index": self.ledger_index}
+        if self.close_time is not None:
+            d["close_time"] = self.close_time
+        if self.precision is not None:
+            d["precision"] = self.precision
+        return d
+
+
 def make_empty_cache(path: str, dt_hint: datetime | None = None) -> dict:
     """
     新フォーマットの空キャッシュを生成する。
@@ -117,12 +348,45 @@ def migrate_old_flat_format(old: dict, path: str) -> dict:
 
     for k, v in old.items():
         # "YYYY-MM-DD" っぽいキーだけ拾う
-        if isinstance(k, str) and re.match(r"^\d{4}-\d{2}-\d{2}$", k):
+        if isinstance(k, str) and _is_ymd(k):
             daily[k] = v
 
     return cache
 
 
+def compress_body(data: bytes) -> tuple[bytes, str | None]:
+    """R2_CONTENT_ENCODING に従って圧縮し、(本体, Content-Encoding) を返す"""
+    if R2_CONTENT_ENCODING == "gzip":
+        # mtime を固定し、同じ内容なら同じバイト列（= 同じ ETag）になるようにする
+        return gzip.compress(data, compresslevel=6, mtime=0), "gzip"
+    if R2_CONTENT_ENCODING == "zstd":
+        if zstandard is None:
+            raise ValueError("R2_CONTENT_ENCODING=zstd には zstandard パッケージが必要です。")
+        return zstandard.ZstdCompressor(level=3).compress(data), "zstd"
+    return data, None
+
+
+def decompress_body(data: bytes, encoding: str | None) -> bytes:
+    """Content-Encoding に応じて本体を展開する（未圧縮ならそのまま）"""
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd 圧縮されたオブジェクトの読み込みには zstandard パッケージが必要です。")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def parse_cache_body(response: dict):
+    """
+    get_object のレスポンス本体を JSON として解析する。
+    - ContentEncoding が gzip / zstd なら展開してから解析する
+    （キャッシュは結局すべてメモリ上の dict にするので、展開後の本体を orjson で一度に解析するのが一番速い）
+    """
+    data = decompress_body(response["Body"].read(), response.get("ContentEncoding"))
+    return orjson.loads(data) if orjson is not None else json.loads(data.decode("utf-8"))
+
+
 def load_cache(key: str) -> dict:
     """
     R2から既存のJSONキャッシュを読み込む。
@@ -135,15 +399,18 @@ def load_cache(key: str) -> dict:
     
     try:
         response = s3.get_object(Bucket=R2_BUCKET_NAME, Key=key)
-        raw = json.loads(response["Body"].read().decode("utf-8"))
+        raw = parse_cache_body(response)
+        _LOADED_ETAGS[key] = response["ETag"].strip('"')
         print(f"R2から読み込み完了: {key}")
     except s3.exceptions.NoSuchKey:
         print(f"{key} がR2に存在しないため、新規作成として扱います。")
+        _LOADED_ETAGS[key] = None
         return make_empty_cache(key)
     except Exception as e:
         # ClientError などでオブジェクトが見つからない場合
         if "NoSuchKey" in str(e) or "404" in str(e):
             print(f"{key} がR2に存在しないため、新規作成として扱います。")
+            _LOADED_ETAGS[key] = None
             return make_empty_cache(key)
         raise
 
@@ -158,6 +425,76 @@ def load_cache(key: str) -> dict:
     return migrate_old_flat_format(raw, key)
 
 
+def get_remote_etag(s3, key: str) -> str | None:
+    """R2 上のオブジェクトの ETag を返す（存在しなければ None）"""
+    try:
+        head = s3.head_object(Bucket=R2_BUCKET_NAME, Key=key)
+    except Exception as e:
+        if "404" in str(e) or "NoSuchKey" in str(e) or "Not Found" in str(e):
+            return None
+        raise
+    return head["ETag"].strip('"')
+
+
+def is_write_conflict(e: ClientError) -> bool:
+    """条件付き書き込みが他の実行との競合で弾かれたか（412 / 409）"""
+    error = e.response.get("Error", {})
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return error.get("Code") in ("PreconditionFailed", "ConditionalRequestConflict") or status in (409, 412)
+
+
+def merge_remote_changes(key: str, cache: dict) -> None:
+    """
+    R2 上の最新の内容を読み込み直し、こちらに無いエントリだけを cache に取り込む。
+    追記は日付・時刻ごとに独立しているので、キー単位の和集合でマージすればよい
+    （同じキーがあればこちらの値を優先）。呼び出し側が持っている dict をそのまま更新する。
+    """
+    remote = load_cache(key)
+    for section in ("daily", "hourly"):
+        ours = cache.setdefault(section, {})
+        for k, v in remote.get(section, {}).items():
+            ours.setdefault(k, v)
+
+
+def put_cache_object(s3, key: str, body: bytes, extra_args: dict) -> str | None:
+    """
+    JSON 本体をアップロードし、新しい ETag を返す。
+    load_cache で読んだときの ETag を条件にするので、その後に他の実行が書き込んでいれば
+    412 (ClientError) になる。
+    """
+    if key not in _LOADED_ETAGS:
+        conditions = {}
+    elif _LOADED_ETAGS[key] is None:
+        conditions = {"IfNoneMatch": "*"}
+    else:
+        conditions = {"IfMatch": f'"{_LOADED_ETAGS[key]}"'}
+
+    if len(body) > R2_MULTIPART_THRESHOLD:
+        # upload_fileobj は条件付き書き込みに対応していないので、
+        # 直前の ETag 確認（save_cache 側）だけで競合を検出する
+        s3.upload_fileobj(
+            BytesIO(body),
+            R2_BUCKET_NAME,
+            key,
+            ExtraArgs={"ContentType": "application/json", **extra_args},
+            Config=TransferConfig(
+                multipart_threshold=R2_MULTIPART_THRESHOLD,
+                max_concurrency=4,
+            ),
+        )
+        return get_remote_etag(s3, key)
+
+    response = s3.put_object(
+        Bucket=R2_BUCKET_NAME,
+        Key=key,
+        Body=body,
+        ContentType="application/json",
+        **extra_args,
+        **conditions,
+    )
+    return response["ETag"].strip('"')
+
+
 def save_cache(key: str, cache: dict) -> None:
     """
     キャッシュを日付順・日時順にソートしてR2に保存。
@@ -166,45 +503,118 @@ def save_cache(key: str, cache: dict) -> None:
     
     key: R2上のオブジェクトキー (例: "ledger_cache_2025.json")
     """
-    meta = cache.get("meta", {})
-    daily = cache.get("daily", {})
-    hourly = cache.get("hourly", {})
+    s3 = get_r2_client()
 
-    # daily はキー (YYYY-MM-DD) でソート
-    daily_sorted = {k: daily[k] for k in sorted(daily.keys())}
+    for attempt in range(1, R2_SAVE_MAX_RETRIES + 1):
+        meta = cache.get("meta", {})
+        daily = cache.get("daily", {})
+        hourly = cache.get("hourly", {})
 
-    # hourly は ISO文字列キーでソート
-    hourly_sorted = {k: hourly[k] for k in sorted(hourly.keys())}
+        # キーのソートはエンコーダ側（orjson の OPT_SORT_KEYS / json の sort_keys）に任せる
+        out = {
+            "meta": meta,
+            "daily": daily,
+            "hourly": hourly,
+        }
 
-    out = {
-        "meta": meta,
-        "daily": daily_sorted,
-        "hourly": hourly_sorted,
-    }
+        if orjson is not None:
+            json_bytes = orjson.dumps(out, option=_ORJSON_OPTIONS)
+        else:
+            json_bytes = json.dumps(out, ensure_ascii=False, sort_keys=True, **_JSON_FORMAT).encode("utf-8")
 
-    json_bytes = json.dumps(out, ensure_ascii=False, indent=2).encode("utf-8")
-    
-    s3 = get_r2_client()
-    s3.put_object(
-        Bucket=R2_BUCKET_NAME,
-        Key=key,
-        Body=BytesIO(json_bytes),
-        ContentType="application/json",
-    )
+        body, content_encoding = compress_body(json_bytes)
+        extra_args = {"ContentEncoding": content_encoding} if content_encoding else {}
 
-    print(f"R2に保存完了: {key} (daily={len(daily_sorted)}, hourly={len(hourly_sorted)})")
+        remote_etag = get_remote_etag(s3, key)
+        if key in _LOADED_ETAGS and remote_etag != _LOADED_ETAGS[key]:
+            print(f"{key} は読み込み後に他の実行で更新されています。取り込み直して保存し直します ({attempt}/{R2_SAVE_MAX_RETRIES})")
+            merge_remote_changes(key, cache)
+            continue
 
+        # 単一パートでアップロードしたオブジェクトの ETag は本体の MD5 なので、
+        # 一致すれば中身は同じ → 無駄な PUT を省く
+        if remote_etag == hashlib.md5(body).hexdigest():
+            print(f"R2上の内容と同一のため保存スキップ: {key}")
+            break
 
-def get_ledger_index_by_date(dt: datetime, max_iter: int = 5) -> tuple[int, datetime]:
+        try:
+            _LOADED_ETAGS[key] = put_cache_object(s3, key, body, extra_args)
+        except ClientError as e:
+            if not is_write_conflict(e):
+                raise
+            print(f"{key} の保存が他の実行と競合しました。取り込み直して保存し直します ({attempt}/{R2_SAVE_MAX_RETRIES})")
+            merge_remote_changes(key, cache)
+            continue
+
+        print(
+            f"R2に保存完了: {key} (daily={len(daily)}, hourly={len(hourly)}, "
+            f"{len(json_bytes)} → {len(body)} bytes, encoding={content_encoding or 'identity'})"
+        )
+        break
+    else:
+        raise RuntimeError(f"{key} の保存が他の実行との競合で {R2_SAVE_MAX_RETRIES} 回失敗しました")
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_ledger(ttl_bucket: int) -> tuple[int, datetime]:
+    latest = xrpl_request(Ledger(ledger_index="validated", transactions=False, expand=False)).result
+    return int(latest["ledger_index"]), ripple_time_to_datetime(latest["ledger"]["close_time"])
+
+
+def get_latest_ledger() -> tuple[int, datetime]:
+    """
+    最新の validated レジャーの (ledger_index, close_time) を返す。
+    LATEST_LEDGER_TTL 秒ごとのバケットをキーに lru_cache しているので、
+    同じ実行中の日付ごとに毎回問い合わせることはない。
+    """
+    return _fetch_latest_ledger(int(time.monotonic() // LATEST_LEDGER_TTL))
+
+
+def find_daily_bracket(
+    daily: dict,
+    keys: list[str],
+    dt: datetime,
+) -> tuple[tuple[int, datetime] | None, tuple[int, datetime] | None]:
+    """
+    daily の既存エントリから、dt を挟む直前・直後のもの (ledger_index, close_time) を探す。
+    keys は daily のキーをソートしたもの（呼び出し側で1回だけ作って使い回す）。
+    見つからない側は None。
+    """
+    date_key = date_key_of(dt)
+
+    lo = None
+    pos = bisect_left(keys, date_key)
+    if pos > 0:
+        entry = daily[keys[pos - 1]]
+        lo_time = datetime.fromisoformat(entry["close_time"].replace("Z", "+00:00"))
+        if lo_time < dt:
+            lo = (int(entry["ledger_index"]), lo_time)
+
+    hi = None
+    pos = bisect_right(keys, date_key)
+    if pos < len(keys):
+        entry = daily[keys[pos]]
+        hi_time = datetime.fromisoformat(entry["close_time"].replace("Z", "+00:00"))
+        if hi_time > dt:
+            hi = (int(entry["ledger_index"]), hi_time)
+
+    return lo, hi
+
+
+def get_ledger_index_by_date(
+    dt: datetime,
+    max_iter: int = 5,
+    bracket: tuple[tuple[int, datetime] | None, tuple[int, datetime] | None] = (None, None),
+) -> tuple[int, datetime]:
     """
     指定日時に最も近い ledger index をラフに推定する。
 
     - dt が最新レジャーの close_time より未来なら FutureLedgerError を投げる
     - それ以外は「誤差1時間以内」のラフ値を返す（後段で補正前提）
+    - bracket に dt を挟む既存 daily（find_daily_bracket）を渡すと、
+      初期推定をそこから補間し、推定位置もその間に収める（最新レジャーから遡るより数回少なく済む）
     """
-    latest = client.request(Ledger(ledger_index="validated", expand=True)).result
-    latest_index = int(latest["ledger_index"])
-    latest_time = ripple_time_to_datetime(latest["ledger"]["close_time"])
+    latest_index, latest_time = get_latest_ledger()
 
     # 🟡 ここで「未来日付」を判定
     if dt > latest_time:
@@ -212,14 +622,25 @@ def get_ledger_index_by_date(dt: datetime, max_iter: int = 5) -> tuple[int, date
             f"target datetime {dt.isoformat()} is newer than latest ledger close_time {latest_time.isoformat()}"
         )
 
-    # 初期推定: 4秒/ledger と仮定
-    delta = (latest_time - dt).total_seconds()
-    guess_index = latest_index - int(delta / 4)
+    lo, hi = bracket
+    lo_index = lo[0] if lo else 1
+    hi_index = hi[0] if hi else latest_index
+    hi_time = hi[1] if hi else latest_time
+
+    # 初期推定: 両側の daily があれば時刻の比率で補間、なければ近い側から 4秒/ledger と仮定
+    if lo and hi:
+        frac = (dt - lo[1]).total_seconds() / max((hi_time - lo[1]).total_seconds(), 1)
+        guess_index = lo_index + int(frac * (hi_index - lo_index))
+    elif lo:
+        guess_index = lo_index + int((dt - lo[1]).total_seconds() / 4)
+    else:
+        guess_index = hi_index - int((hi_time - dt).total_seconds() / 4)
+    guess_index = min(max(guess_index, lo_index), hi_index)
 
     close_time = latest_time  # fallback
 
     for i in range(max_iter):
-        res = client.request(Ledger(ledger_index=guess_index, expand=True)).result
+        res = xrpl_request(Ledger(ledger_index=guess_index, transactions=False, expand=False)).result
         close_time = ripple_time_to_datetime(res["ledger"]["close_time"])
 
         diff = (close_time - dt).total_seconds()
@@ -229,10 +650,7 @@ def get_ledger_index_by_date(dt: datetime, max_iter: int = 5) -> tuple[int, date
             return guess_index, close_time
 
         guess_index -= int(diff / 4)
-        if guess_index < 1:
-            guess_index = 1
-
-        time.sleep(0.3)
+        guess_index = min(max(guess_index, lo_index), hi_index)
 
     return guess_index, close_time
 
@@ -243,9 +661,7 @@ def get_ledger_index_by_date_binary(dt: datetime,
     target_date = dt.date()
 
     # 最新レジャー
-    latest = client.request(Ledger(ledger_index="validated", expand=True)).result
-    hi_idx = int(latest["ledger_index"])
-    hi_time = ripple_time_to_datetime(latest["ledger"]["close_time"])
+    hi_idx, hi_time = get_latest_ledger()
 
     # 未来チェック
     if dt > hi_time:
@@ -254,7 +670,7 @@ def get_ledger_index_by_date_binary(dt: datetime,
         )
 
     # GENESIS レジャー
-    genesis = client.request(Ledger(ledger_index=GENESIS_INDEX, expand=True)).result
+    genesis = xrpl_request(Ledger(ledger_index=GENESIS_INDEX, transactions=False, expand=False)).result
     lo_idx = GENESIS_INDEX
     lo_time = ripple_time_to_datetime(genesis["ledger"]["close_time"])
 
@@ -268,7 +684,7 @@ def get_ledger_index_by_date_binary(dt: datetime,
 
     for i in range(max_iter):
         mid = (lo_idx + hi_idx) // 2
-        res = client.request(Ledger(ledger_index=mid, expand=True)).result
+        res = xrpl_request(Ledger(ledger_index=mid, transactions=False, expand=False)).result
         mid_time = ripple_time_to_datetime(res["ledger"]["close_time"])
         mid_date = mid_time.date()
 
@@ -291,8 +707,6 @@ def get_ledger_index_by_date_binary(dt: datetime,
         if lo_idx > hi_idx:
             break
 
-        time.sleep(0.3)
-
     return best_idx, best_time
 
 
@@ -306,42 +720,44 @@ def append_rough_ledger_cache(key: str, dt_start: datetime, dt_end: datetime) ->
     daily: dict = cache.setdefault("daily", {})
     cache.setdefault("hourly", {})  # まだ使わないが念のため確保
 
-    cur = dt_start
     total_days = (dt_end.date() - dt_start.date()).days + 1
-    processed = 0
     added = 0
 
     print(f"{dt_start.date()} ～ {dt_end.date()} の不足分を {key} の daily に追記します。")
 
-    while cur <= dt_end:
-        processed += 1
-        date_key = cur.strftime("%Y-%m-%d")
+    # 対象日のキーを先にまとめて作り、既存の日を一度に取り除く
+    wanted = {}
+    for i in range(total_days):
+        day = dt_start + timedelta(days=i)
+        wanted[date_key_of(day)] = day
+    missing = sorted(wanted.keys() - daily.keys())
+    # 推定の起点にする既存 daily（追加した日も順に差し込んで、次の日の起点に使う）
+    daily_keys = sorted(daily)
+
+    print(f"既存 {total_days - len(missing)} 日をスキップし、{len(missing)} 日を追加処理します。")
+
+    for processed, date_key in enumerate(missing, start=1):
+        print(f"[{processed}/{len(missing)}] {date_key}: daily 追加処理開始")
+        try:
+            bracket = find_daily_bracket(daily, daily_keys, wanted[date_key])
+            idx, close_time = get_ledger_index_by_date(wanted[date_key], bracket=bracket)
+            daily[date_key] = {
+                "ledger_index": idx,
+                "close_time": close_time.isoformat().replace("+00:00", "Z"),
+            }
+            insort(daily_keys, date_key)
+            added += 1
+            print(f"   ↳ 追加: ledger={idx}, close_time={close_time}")
+        except FutureLedgerError as e:
+            # まだレジャーが存在しない（未来日付）の場合は「正常スキップ」とみなす
+            print(f"   ⏭ 未来日付のためスキップ: {e}")
+            # この日以降は全部未来確定なのでループ終了でよい
+            break
+        except Exception as e:
+            print(f"   追加失敗（別原因）: {e}")
+            time.sleep(3)
 
-        if date_key in daily:
-            print(f"[{processed}/{total_days}] {date_key}: daily 既存エントリあり → スキップ")
-        else:
-            print(f"[{processed}/{total_days}] {date_key}: daily 追加処理開始")
-            try:
-                idx, close_time = get_ledger_index_by_date(cur)
-                daily[date_key] = {
-                    "ledger_index": idx,
-                    "close_time": close_time.isoformat().replace("+00:00", "Z"),
-                }
-                added += 1
-                print(f"   ↳ 追加: ledger={idx}, close_time={close_time}")
-                time.sleep(1)  # 成功時だけウェイト
-            except FutureLedgerError as e:
-                # まだレジャーが存在しない（未来日付）の場合は「正常スキップ」とみなす
-                print(f"   ⏭ 未来日付のためスキップ: {e}")
-                # この日以降は全部未来確定なのでループ終了でよい
-                break
-            except Exception as e:
-                print(f"   追加失敗（別原因）: {e}")
-                time.sleep(3)
-
-        cur += timedelta(days=1)
-
-    print(f"\n 処理完了: {processed} 日中 {added} 日を daily に追加")
+    print(f"\n 処理完了: {total_days} 日中 {added} 日を daily に追加")
     
     # 変更があった場合のみ保存
     if added > 0:
@@ -354,8 +770,9 @@ def parse_date(s: str) -> datetime:
     return datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc)
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 4:
+def main(argv: list[str]) -> int:
+    """コマンドライン引数（プログラム名を除く）を受け取って実行する。戻り値は終了コード"""
+    if len(argv) != 3:
         print("使い方:")
         print("  python append_rough_ledger_cache.py <r2_key> <start_date> <end_date>")
         print("例:")
@@ -366,10 +783,15 @@ if __name__ == "__main__":
         print("  R2_ACCESS_KEY_ID    - R2のアクセスキーID")
         print("  R2_SECRET_ACCESS_KEY - R2のシークレットアクセスキー")
         print("  R2_BUCKET_NAME      - バケット名")
-        sys.exit(1)
+        return 1
 
-    r2_key = sys.argv[1]
-    start_dt = parse_date(sys.argv[2])
-    end_dt = parse_date(sys.argv[3])
+    r2_key = argv[0]
+    start_dt = parse_date(argv[1])
+    end_dt = parse_date(argv[2])
 
     append_rough_ledger_cache(r2_key, start_dt, end_dt)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -21,39 +21,124 @@ R2 に保存します。
 
 使い方:
   python generate_hourly_clio.py ledger_cache_2025.json 2025-01-01 2025-12-31
+  python generate_hourly_clio.py ledger_cache_2025.json 2025-01-01 2025-12-31 --format msgpack
 """
 
+import argparse
+import asyncio
+import gzip
+import hashlib
 import json
 import os
 import re
-import sys
+import threading
 import time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from io import BytesIO
 
 import boto3
-import requests
+import httpx
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準 json で代替
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstd を使わなければ不要
+    zstandard = None
+
+try:
+    import h2  # noqa: F401  httpx で HTTP/2 を使うのに必要
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
 # ====== Clio 設定 ======
 CLIO_URL = "https://s1.ripple.com:51234/"
+CLIO_MAX_WORKERS = 8  # 同時に投げるリクエスト数
+CLIO_RATE_PER_SEC = 5.0  # 1秒あたりの最大リクエスト数（レート制限対策）
+
+# 単発の問い合わせ用。接続は keep-alive で使い回す（リクエストごとの TLS ハンドシェイクを避ける）
+# まとめて問い合わせる場合は fetch_ledger_indexes が非同期クライアントを使う
+_HTTP = httpx.Client(http2=_HTTP2, timeout=30)
 
 # ====== R2 設定 ======
 R2_ACCOUNT_ID = os.environ.get("R2_ACCOUNT_ID", "")
 R2_ACCESS_KEY_ID = os.environ.get("R2_ACCESS_KEY_ID", "")
 R2_SECRET_ACCESS_KEY = os.environ.get("R2_SECRET_ACCESS_KEY", "")
 R2_BUCKET_NAME = os.environ.get("R2_BUCKET_NAME", "")
+# これを超えるサイズはマルチパート（並列）アップロードにする
+R2_MULTIPART_THRESHOLD = 8 * 1024 ** 2
+# R2 に置く JSON の圧縮方式（gzip / zstd / identity）。gzip ならブラウザ等でもそのまま展開される
+R2_CONTENT_ENCODING = os.environ.get("R2_CONTENT_ENCODING", "gzip")
+# 他の実行と書き込みが競合したときに、取り込み直して保存し直す回数
+R2_SAVE_MAX_RETRIES = 3
+
+# ====== JSON 出力設定 ======
+# 既定はコンパクト出力。デバッグ用に人が読める形にしたい場合は PRETTY_JSON=1 を設定する
+PRETTY_JSON = bool(os.environ.get("PRETTY_JSON"))
+_JSON_FORMAT = {"indent": 2} if PRETTY_JSON else {"separators": (",", ":")}
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    if PRETTY_JSON:
+        _ORJSON_OPTIONS |= orjson.OPT_INDENT_2
+
+
+class RateLimiter:
+    """
+    トークンバケット型のレート制限。
+    トークンが尽きたときだけ待つので、サーバーに余裕がある間はまとめて投げられる。
+    reserve() が待ち秒数を返すので、スレッドからも asyncio からも使える。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """トークンを1つ予約し、それが使えるようになるまでの待ち秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+
+_clio_limiter = RateLimiter(CLIO_RATE_PER_SEC, burst=CLIO_MAX_WORKERS)
+
+
+_R2_CLIENT = None
+# load_cache で読んだ時点の ETag（キーごと。存在しなかったキーは None）。
+# save_cache はこれを条件（If-Match / If-None-Match）にして上書きする
+_LOADED_ETAGS: dict[str, str | None] = {}
 
 
 def get_r2_client():
-    """R2用のboto3クライアントを取得"""
+    """R2用のboto3クライアントを取得（生成は初回のみで、以降は使い回す）"""
+    global _R2_CLIENT
+    if _R2_CLIENT is not None:
+        return _R2_CLIENT
+
     if not all([R2_ACCOUNT_ID, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY]):
         raise ValueError(
             "R2の認証情報が設定されていません。\n"
             "環境変数 R2_ACCOUNT_ID, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY を設定してください。"
         )
     
-    return boto3.client(
+    _R2_CLIENT = boto3.client(
         "s3",
         endpoint_url=f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com",
         aws_access_key_id=R2_ACCESS_KEY_ID,
@@ -61,9 +146,16 @@ def get_r2_client():
         config=Config(
             signature_version="s3v4",
             retries={"max_attempts": 3, "mode": "standard"},
+            max_pool_connections=32,
         ),
         region_name="auto",
     )
+    return _R2_CLIENT
+
+
+def hour_key(dt: datetime) -> str:
+    """hourly のキー（2025-01-01T00:00:00Z 形式）。strftime より速いので f-string で組み立てる"""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}Z"
 
 
 def clio_ledger_index(dt: datetime) -> dict | None:
@@ -79,19 +171,27 @@ def clio_ledger_index(dt: datetime) -> dict | None:
         }
         または None（未来の日時など）
     """
-    date_str = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-    
-    payload = {
+    response = _HTTP.post(CLIO_URL, json=ledger_index_payload(dt))
+    return parse_ledger_index_response(response)
+
+
+def ledger_index_payload(dt: datetime) -> dict:
+    """ledger_index コマンドのリクエストボディ"""
+    date_str = hour_key(dt)
+
+    return {
         "method": "ledger_index",
         "params": [{
             "date": date_str
         }]
     }
-    
-    response = requests.post(CLIO_URL, json=payload, timeout=30)
+
+
+def parse_ledger_index_response(response: httpx.Response) -> dict | None:
+    """ledger_index コマンドのレスポンスを解釈する（戻り値は clio_ledger_index と同じ）"""
     response.raise_for_status()
     
-    data = response.json()
+    data = orjson.loads(response.content) if orjson is not None else response.json()
     
     if "result" not in data:
         return None
@@ -107,9 +207,79 @@ def clio_ledger_index(dt: datetime) -> dict | None:
     return result
 
 
+async def _fetch_ledger_indexes_async(targets: list[datetime]) -> dict[datetime, dict | None]:
+    results: dict[datetime, dict | None] = {}
+    total = len(targets)
+    done = 0
+    # lgrNotFound が返った最も早い時刻。これより後はデータなし確定なので問い合わせない
+    cutoff: datetime | None = None
+    semaphore = asyncio.Semaphore(CLIO_MAX_WORKERS)
+    limits = httpx.Limits(max_connections=CLIO_MAX_WORKERS)
+
+    async with httpx.AsyncClient(http2=_HTTP2, timeout=30, limits=limits) as client:
+
+        async def fetch(dt: datetime) -> None:
+            nonlocal done, cutoff
+
+            async with semaphore:
+                if cutoff is not None and dt > cutoff:
+                    return
+
+                await asyncio.sleep(_clio_limiter.reserve())
+                key_iso = hour_key(dt)
+
+                try:
+                    response = await client.post(CLIO_URL, json=ledger_index_payload(dt))
+                    result = parse_ledger_index_response(response)
+                except Exception as e:
+                    done += 1
+                    print(f"[{done}/{total}] {key_iso}: ✗ エラー: {e}")
+                    return
+
+                done += 1
+                results[dt] = result
+
+                if result is None:
+                    print(f"[{done}/{total}] {key_iso}: ⏭ データなし")
+                    if cutoff is None or dt < cutoff:
+                        cutoff = dt
+                    return
+
+                print(f"[{done}/{total}] {key_iso}: ✓ ledger={result['ledger_index']}, closed={result['closed']}")
+
+        await asyncio.gather(*(fetch(dt) for dt in targets))
+
+    return results
+
+
+def fetch_ledger_indexes(targets: list[datetime]) -> dict[datetime, dict | None]:
+    """
+    targets の各時刻について ledger_index を並列に問い合わせる。
+    1本のイベントループ上で httpx.AsyncClient を使い、同時実行数は CLIO_MAX_WORKERS、
+    送信レートは CLIO_RATE_PER_SEC で制限する（h2 があれば HTTP/2 で多重化）。
+
+    Returns:
+        { 時刻: clio_ledger_index の戻り値 }
+        エラーになった時刻、データなし確定で問い合わせなかった時刻は含めない（ログのみ出力）
+    """
+    return asyncio.run(_fetch_ledger_indexes_async(targets))
+
+
+_YEAR_RE = re.compile(r"(\d{4})")
+
+
+def _is_ymd(k: str) -> bool:
+    """k が YYYY-MM-DD 形式か（旧フォーマットの移行で全キーに使うので、正規表現を使わずに判定する）"""
+    return (
+        len(k) == 10 and k[4] == "-" and k[7] == "-"
+        and k[:4].isdigit() and k[5:7].isdigit() and k[8:].isdigit()
+    )
+
+
+@lru_cache(maxsize=128)
 def infer_year_from_key(key: str) -> int | None:
     """キーから年を推測"""
-    m = re.search(r"(\d{4})", os.path.basename(key))
+    m = _YEAR_RE.search(os.path.basename(key))
     if m:
         return int(m.group(1))
     return None
@@ -133,20 +303,56 @@ def make_empty_cache(key: str, dt_hint: datetime | None = None) -> dict:
     }
 
 
+def compress_body(data: bytes) -> tuple[bytes, str | None]:
+    """R2_CONTENT_ENCODING に従って圧縮し、(本体, Content-Encoding) を返す"""
+    if R2_CONTENT_ENCODING == "gzip":
+        # mtime を固定し、同じ内容なら同じバイト列（= 同じ ETag）になるようにする
+        return gzip.compress(data, compresslevel=6, mtime=0), "gzip"
+    if R2_CONTENT_ENCODING == "zstd":
+        if zstandard is None:
+            raise ValueError("R2_CONTENT_ENCODING=zstd には zstandard パッケージが必要です。")
+        return zstandard.ZstdCompressor(level=3).compress(data), "zstd"
+    return data, None
+
+
+def decompress_body(data: bytes, encoding: str | None) -> bytes:
+    """Content-Encoding に応じて本体を展開する（未圧縮ならそのまま）"""
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd 圧縮されたオブジェクトの読み込みには zstandard パッケージが必要です。")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def parse_cache_body(response: dict):
+    """
+    get_object のレスポンス本体を JSON として解析する。
+    - ContentEncoding が gzip / zstd なら展開してから解析する
+    （キャッシュは結局すべてメモリ上の dict にするので、展開後の本体を orjson で一度に解析するのが一番速い）
+    """
+    data = decompress_body(response["Body"].read(), response.get("ContentEncoding"))
+    return orjson.loads(data) if orjson is not None else json.loads(data.decode("utf-8"))
+
+
 def load_cache(key: str) -> dict:
     """R2から既存のJSONキャッシュを読み込む"""
     s3 = get_r2_client()
     
     try:
         response = s3.get_object(Bucket=R2_BUCKET_NAME, Key=key)
-        raw = json.loads(response["Body"].read().decode("utf-8"))
+        raw = parse_cache_body(response)
+        _LOADED_ETAGS[key] = response["ETag"].strip('"')
         print(f"R2から読み込み完了: {key}")
     except s3.exceptions.NoSuchKey:
         print(f"{key} がR2に存在しないため、新規作成として扱います。")
+        _LOADED_ETAGS[key] = None
         return make_empty_cache(key)
     except Exception as e:
         if "NoSuchKey" in str(e) or "404" in str(e):
             print(f"{key} がR2に存在しないため、新規作成として扱います。")
+            _LOADED_ETAGS[key] = None
             return make_empty_cache(key)
         raise
 
@@ -158,42 +364,315 @@ def load_cache(key: str) -> dict:
     cache = make_empty_cache(key)
     if isinstance(raw, dict):
         for k, v in raw.items():
-            if isinstance(k, str) and re.match(r"^\d{4}-\d{2}-\d{2}$", k):
+            if isinstance(k, str) and _is_ymd(k):
                 cache["daily"][k] = v
     return cache
 
 
-def save_cache(key: str, cache: dict) -> None:
-    """キャッシュをR2に保存"""
-    meta = cache.get("meta", {})
-    daily = cache.get("daily", {})
-    hourly = cache.get("hourly", {})
+def get_remote_etag(s3, key: str) -> str | None:
+    """R2 上のオブジェクトの ETag を返す（存在しなければ None）"""
+    try:
+        head = s3.head_object(Bucket=R2_BUCKET_NAME, Key=key)
+    except Exception as e:
+        if "404" in str(e) or "NoSuchKey" in str(e) or "Not Found" in str(e):
+            return None
+        raise
+    return head["ETag"].strip('"')
 
-    daily_sorted = {k: daily[k] for k in sorted(daily.keys())}
-    hourly_sorted = {k: hourly[k] for k in sorted(hourly.keys())}
 
-    out = {
-        "meta": meta,
-        "daily": daily_sorted,
-        "hourly": hourly_sorted,
-    }
+def is_write_conflict(e: ClientError) -> bool:
+    """条件付き書き込みが他の実行との競合で弾かれたか（412 / 409）"""
+    error = e.response.get("Error", {})
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return error.get("Code") in ("PreconditionFailed", "ConditionalRequestConflict") or status in (409, 412)
 
-    json_bytes = json.dumps(out, ensure_ascii=False, indent=2).encode("utf-8")
-    
-    s3 = get_r2_client()
-    s3.put_object(
+
+def merge_remote_changes(key: str, cache: dict) -> None:
+    """
+    R2 上の最新の内容を読み込み直し、こちらに無いエントリだけを cache に取り込む。
+    追記は日付・時刻ごとに独立しているので、キー単位の和集合でマージすればよい
+    （同じキーがあればこちらの値を優先）。呼び出し側が持っている dict をそのまま更新する。
+    """
+    remote = load_cache(key)
+    for section in ("daily", "hourly"):
+        ours = cache.setdefault(section, {})
+        for k, v in remote.get(section, {}).items():
+            ours.setdefault(k, v)
+
+
+def put_cache_object(s3, key: str, body: bytes, extra_args: dict) -> str | None:
+    """
+    JSON 本体をアップロードし、新しい ETag を返す。
+    load_cache で読んだときの ETag を条件にするので、その後に他の実行が書き込んでいれば
+    412 (ClientError) になる。
+    """
+    if key not in _LOADED_ETAGS:
+        conditions = {}
+    elif _LOADED_ETAGS[key] is None:
+        conditions = {"IfNoneMatch": "*"}
+    else:
+        conditions = {"IfMatch": f'"{_LOADED_ETAGS[key]}"'}
+
+    if len(body) > R2_MULTIPART_THRESHOLD:
+        # upload_fileobj は条件付き書き込みに対応していないので、
+        # 直前の ETag 確認（save_cache 側）だけで競合を検出する
+        s3.upload_fileobj(
+            BytesIO(body),
+            R2_BUCKET_NAME,
+            key,
+            ExtraArgs={"ContentType": "application/json", **extra_args},
+            Config=TransferConfig(
+                multipart_threshold=R2_MULTIPART_THRESHOLD,
+                max_concurrency=4,
+            ),
+        )
+        return get_remote_etag(s3, key)
+
+    response = s3.put_object(
         Bucket=R2_BUCKET_NAME,
         Key=key,
-        Body=BytesIO(json_bytes),
+        Body=body,
         ContentType="application/json",
+        **extra_args,
+        **conditions,
     )
+    return response["ETag"].strip('"')
+
+
+OUTPUT_FORMATS = ("json", "msgpack", "parquet")
+
+
+def sidecar_name(name: str, suffix: str) -> str:
+    """ledger_cache_2025.json → ledger_cache_2025{suffix}"""
+    base = name[: -len(".json")] if name.endswith(".json") else name
+    return f"{base}{suffix}"
+
+
+def encode_sidecars(out: dict, output_format: str) -> list[tuple[str, bytes, str]]:
+    """
+    JSON と並べて置くバイナリ形式のデータを作る。
+    戻り値は (ファイル名の末尾, 中身, Content-Type) のリスト（json なら空）。
+
+    - msgpack: JSON と同じ構造をそのまま packb したもの
+    - parquet: daily / hourly をそれぞれ (key, ledger_index, close_time, precision) の表にしたもの
+      （補間値は close_time が null）
+    """
+    if output_format == "msgpack":
+        import msgpack  # 使うときだけ読み込む（任意の依存）
+
+        return [(".msgpack", msgpack.packb(out, use_bin_type=True), "application/msgpack")]
+
+    if output_format == "parquet":
+        import pyarrow as pa  # 使うときだけ読み込む（任意の依存）
+        import pyarrow.parquet as pq
+
+        files = []
+        for section in ("daily", "hourly"):
+            entries = out.get(section, {})
+            keys = sorted(entries)
+            table = pa.table({
+                "key": pa.array(keys, type=pa.string()),
+                "ledger_index": pa.array([int(entries[k]["ledger_index"]) for k in keys], type=pa.int64()),
+                "close_time": pa.array([entries[k].get("close_time") for k in keys], type=pa.string()),
+                "precision": pa.array([entries[k].get("precision") for k in keys], type=pa.string()),
+            })
+            buf = pa.BufferOutputStream()
+            pq.write_table(table, buf)
+            files.append((f"_{section}.parquet", buf.getvalue().to_pybytes(), "application/vnd.apache.parquet"))
+        return files
+
+    return []
+
+
+def save_cache(key: str, cache: dict, output_format: str = "json") -> None:
+    """
+    キャッシュをR2に保存
+
+    output_format が msgpack / parquet の場合は、JSON に加えて
+    同じ内容のバイナリ形式を隣のキーにも保存する。
+    """
+    s3 = get_r2_client()
+
+    for attempt in range(1, R2_SAVE_MAX_RETRIES + 1):
+        meta = cache.get("meta", {})
+        daily = cache.get("daily", {})
+        hourly = cache.get("hourly", {})
+
+        # キーのソートはエンコーダ側（orjson の OPT_SORT_KEYS / json の sort_keys）に任せる
+        out = {
+            "meta": meta,
+            "daily": daily,
+            "hourly": hourly,
+        }
+
+        if orjson is not None:
+            json_bytes = orjson.dumps(out, option=_ORJSON_OPTIONS)
+        else:
+            json_bytes = json.dumps(out, ensure_ascii=False, sort_keys=True, **_JSON_FORMAT).encode("utf-8")
+
+        body, content_encoding = compress_body(json_bytes)
+        extra_args = {"ContentEncoding": content_encoding} if content_encoding else {}
+
+        remote_etag = get_remote_etag(s3, key)
+        if key in _LOADED_ETAGS and remote_etag != _LOADED_ETAGS[key]:
+            print(f"{key} は読み込み後に他の実行で更新されています。取り込み直して保存し直します ({attempt}/{R2_SAVE_MAX_RETRIES})")
+            merge_remote_changes(key, cache)
+            continue
+
+        # 単一パートでアップロードしたオブジェクトの ETag は本体の MD5 なので、
+        # 一致すれば中身は同じ → 無駄な PUT を省く
+        if remote_etag == hashlib.md5(body).hexdigest():
+            print(f"R2上の内容と同一のため保存スキップ: {key}")
+            break
+
+        try:
+            _LOADED_ETAGS[key] = put_cache_object(s3, key, body, extra_args)
+        except ClientError as e:
+            if not is_write_conflict(e):
+                raise
+            print(f"{key} の保存が他の実行と競合しました。取り込み直して保存し直します ({attempt}/{R2_SAVE_MAX_RETRIES})")
+            merge_remote_changes(key, cache)
+            continue
+
+        print(
+            f"R2に保存完了: {key} (daily={len(daily)}, hourly={len(hourly)}, "
+            f"{len(json_bytes)} → {len(body)} bytes, encoding={content_encoding or 'identity'})"
+        )
+        break
+    else:
+        raise RuntimeError(f"{key} の保存が他の実行との競合で {R2_SAVE_MAX_RETRIES} 回失敗しました")
+
+    # バイナリ形式は JSON の保存（競合時のマージ）が済んだ最終的な内容から作る
+    for suffix, data, content_type in encode_sidecars(out, output_format):
+        sidecar_key = sidecar_name(key, suffix)
+        s3.put_object(
+            Bucket=R2_BUCKET_NAME,
+            Key=sidecar_key,
+            Body=data,
+            ContentType=content_type,
+        )
+        print(f"R2に保存完了: {sidecar_key} ({len(data)} bytes)")
+
+
+def parse_iso_time(s: str) -> datetime:
+    """ISO8601 文字列（末尾 Z も可）→ datetime (UTC)"""
+    return datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def interpolate_ledger_index(
+    a_index: int,
+    a_time: datetime,
+    b_index: int,
+    b_time: datetime,
+    t: datetime,
+) -> int:
+    """2つのアンカー (a, b) の間で、時刻 t の ledger_index を線形補間する"""
+    span = (b_time - a_time).total_seconds()
+    if span <= 0:
+        return a_index
+    return a_index + round((b_index - a_index) * (t - a_time).total_seconds() / span)
+
+
+def interpolate_missing(
+    missing: list[tuple[str, datetime]],
+    hourly: dict,
+) -> tuple[dict[str, dict], list[tuple[str, datetime]]]:
+    """
+    各日の 0:00 をアンカーとして Clio で引き、その間の時刻は線形補間で埋める。
+    XRPL のレジャーはほぼ一定間隔で閉じるので、1日あたりの問い合わせが 24回 → 1回で済む。
 
-    print(f"R2に保存完了: {key} (daily={len(daily_sorted)}, hourly={len(hourly_sorted)})")
+    補間したエントリには "precision": "interpolated" を付け、close_time は入れない
+    （実際に閉じたレジャーの時刻ではないため）。
+    --interpolate なしで実行し直すと、Clio の正確な値で置き換えられる。
 
+    Returns:
+        (補間で埋めたエントリ {key_iso: entry}, Clio で個別に引く必要がある (key_iso, 時刻) のリスト)
+        翌日のアンカーがまだ無い日（当日など）は個別に引く側に回す。
+    """
+    anchor_times: set[datetime] = set()
+    for _, cur in missing:
+        day = cur.replace(hour=0, minute=0, second=0, microsecond=0)
+        anchor_times.add(day)
+        anchor_times.add(day + timedelta(days=1))
+
+    # アンカー: 時刻 → (ledger_index, close_time, close_time の元の文字列)
+    anchors: dict[datetime, tuple[int, datetime, str]] = {}
+    to_fetch: list[datetime] = []
+    for t in sorted(anchor_times):
+        entry = hourly.get(hour_key(t))
+        if entry and entry.get("precision") != "interpolated":
+            anchors[t] = (int(entry["ledger_index"]), parse_iso_time(entry["close_time"]), entry["close_time"])
+        else:
+            to_fetch.append(t)
+
+    print(f"アンカー（各日 0:00）{len(anchor_times)} 件、うち Clio 問い合わせ {len(to_fetch)} 件")
+
+    for t, result in fetch_ledger_indexes(to_fetch).items():
+        if result is None:
+            continue
+        try:
+            anchors[t] = (int(result["ledger_index"]), parse_iso_time(result["closed"]), result["closed"])
+        except ValueError:
+            print(f"  アンカー {t} の close_time を解釈できないため使わない: {result['closed']}")
+
+    resolved: dict[str, dict] = {}
+    exact: list[tuple[str, datetime]] = []
+
+    for key_iso, cur in missing:
+        day = cur.replace(hour=0, minute=0, second=0, microsecond=0)
+        a = anchors.get(day)
+        b = anchors.get(day + timedelta(days=1))
+
+        if cur == day and a is not None:
+            # アンカーそのものは Clio の値をそのまま使う
+            resolved[key_iso] = {"ledger_index": a[0], "close_time": a[2]}
+        elif a is not None and b is not None:
+            resolved[key_iso] = {
+                "ledger_index": interpolate_ledger_index(a[0], a[1], b[0], b[1], cur),
+                "precision": "interpolated",
+            }
+        else:
+            exact.append((key_iso, cur))
+
+    return resolved, exact
 
-def generate_hourly_for_range(key: str, dt_start: datetime, dt_end: datetime) -> None:
+
+def count_available_hours(dt_start: datetime, total_hours: int) -> int:
+    """
+    dt_start から total_hours 時間のうち、先頭から何時間分 Clio にレジャーがあるかを返す。
+    まず最後の時刻だけを問い合わせ、データがあれば全部ある。
+    無ければ（lgrNotFound）二分探索で境目を探すので、問い合わせは log2(N) 回で済む。
+    """
+    def available(i: int) -> bool:
+        _clio_limiter.acquire()
+        return clio_ledger_index(dt_start + timedelta(hours=i)) is not None
+
+    if available(total_hours - 1):
+        return total_hours
+
+    # lo より前はデータあり、hi はデータなしが確定している
+    lo, hi = 0, total_hours - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if available(mid):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def generate_hourly_for_range(
+    key: str,
+    dt_start: datetime,
+    dt_end: datetime,
+    output_format: str = "json",
+    interpolate: bool = False,
+) -> None:
     """
     Clio API を使って hourly キャッシュを生成
+
+    interpolate=True なら各日 0:00 だけを Clio で引き、残りは線形補間で埋める
+    （interpolate_missing 参照）。False のときは補間済みのエントリも引き直す。
     """
     cache = load_cache(key)
     hourly: dict = cache.setdefault("hourly", {})
@@ -202,15 +681,48 @@ def generate_hourly_for_range(key: str, dt_start: datetime, dt_end: datetime) ->
     now = datetime.now(timezone.utc)
     effective_end = min(dt_end, now)
 
-    cur = dt_start
     total_hours = int(((effective_end - dt_start).total_seconds() // 3600) + 1)
     if total_hours < 1:
         print("処理対象の時間がありません（開始時刻が未来）")
         return
 
-    processed = 0
+    # 対象時刻のキーを先にまとめて作り、既存のものを一度に取り除く
+    # hourly のキー: 2025-01-01T00:00:00Z 形式
+    wanted = {}
+    for i in range(total_hours):
+        cur = dt_start + timedelta(hours=i)
+        wanted[hour_key(cur)] = cur
+    # dict のキービュー同士の集合演算で不足分を求める（ISO 形式なのでソートすれば時刻順）
+    missing_keys = wanted.keys() - hourly.keys()
+    if not interpolate:
+        missing_keys |= {
+            key_iso for key_iso in wanted.keys() & hourly.keys()
+            if hourly[key_iso].get("precision") == "interpolated"
+        }
+    missing = [(key_iso, wanted[key_iso]) for key_iso in sorted(missing_keys)]
+
+    # 不足が無ければ Clio には問い合わせない
+    if not missing:
+        print(f"{dt_start} ～ {effective_end} の hourly はすべて揃っているため処理なし")
+        return
+
+    # 末尾にデータの無い時刻があれば、1時間ずつ問い合わせる前に範囲を縮めておく
+    try:
+        available_hours = count_available_hours(dt_start, total_hours)
+    except Exception as e:
+        print(f"データの有無の事前確認に失敗したため、範囲を縮めずに続けます: {e}")
+        available_hours = total_hours
+    if available_hours < 1:
+        print(f"{dt_start} 以降はデータなしのため処理対象の時間がありません")
+        return
+    if available_hours < total_hours:
+        total_hours = available_hours
+        effective_end = dt_start + timedelta(hours=total_hours - 1)
+        missing = [(key_iso, cur) for key_iso, cur in missing if cur <= effective_end]
+        print(f"{effective_end} より後はデータなしのため、そこまでを処理します")
+
+    processed = total_hours
     added = 0
-    skipped_existing = 0
 
     print(f"{dt_start} ～ {effective_end} の hourly を {key} に生成します。")
     if dt_end > now:
@@ -218,41 +730,38 @@ def generate_hourly_for_range(key: str, dt_start: datetime, dt_end: datetime) ->
     print(f"Clio サーバー: {CLIO_URL}")
     print("-" * 60)
 
-    while cur <= effective_end:
-        processed += 1
-        
-        # hourly のキー: 2025-01-01T00:00:00Z 形式
-        key_iso = cur.strftime("%Y-%m-%dT%H:%M:%SZ")
+    skipped_existing = total_hours - len(missing)
 
-        if key_iso in hourly:
-            print(f"[{processed}/{total_hours}] {key_iso}: 既存 → スキップ")
-            skipped_existing += 1
-            cur += timedelta(hours=1)
-            continue
+    print(f"既存 {skipped_existing} 件、不足 {len(missing)} 件（並列数 {CLIO_MAX_WORKERS}）")
 
-        print(f"[{processed}/{total_hours}] {key_iso}: Clio 問い合わせ ... ", end="", flush=True)
+    if interpolate:
+        resolved, exact = interpolate_missing(missing, hourly)
+        print(f"補間で {len(resolved)} 件を埋め、残り {len(exact)} 件を Clio に問い合わせます")
+    else:
+        resolved, exact = {}, missing
 
-        try:
-            result = clio_ledger_index(cur)
-            
-            if result is None:
-                print(f"⏭ データなし（終了）")
-                break
-            
-            hourly[key_iso] = {
-                "ledger_index": result["ledger_index"],
-                "close_time": result["closed"],
-            }
+    results = fetch_ledger_indexes([cur for _, cur in exact])
+
+    # 時刻順にマージし、最初の「データなし」以降は打ち切る
+    for key_iso, cur in missing:
+        if key_iso in resolved:
+            hourly[key_iso] = resolved[key_iso]
             added += 1
-            print(f"✓ ledger={result['ledger_index']}, closed={result['closed']}")
-            
-            time.sleep(0.2)  # レート制限対策
-            
-        except Exception as e:
-            print(f"✗ エラー: {e}")
-            time.sleep(1)
+            continue
 
-        cur += timedelta(hours=1)
+        if cur not in results:
+            continue  # エラー（ログ出力済み）
+
+        result = results[cur]
+        if result is None:
+            print(f"{key_iso} 以降はデータなしのため終了")
+            break
+
+        hourly[key_iso] = {
+            "ledger_index": result["ledger_index"],
+            "close_time": result["closed"],
+        }
+        added += 1
 
     print()
     print("=" * 60)
@@ -262,7 +771,7 @@ def generate_hourly_for_range(key: str, dt_start: datetime, dt_end: datetime) ->
     print(f"  既存スキップ: {skipped_existing}")
 
     if added > 0:
-        save_cache(key, cache)
+        save_cache(key, cache, output_format)
     else:
         print("変更なしのため保存スキップ")
 
@@ -272,21 +781,44 @@ def parse_date(s: str) -> datetime:
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("使い方:")
-        print("  python generate_hourly_clio.py <r2_key> <start_date> <end_date>")
-        print("例:")
-        print("  python generate_hourly_clio.py ledger_cache_2025.json 2025-01-01 2025-12-31")
-        print()
-        print("環境変数:")
-        print("  R2_ACCOUNT_ID       - CloudflareアカウントID")
-        print("  R2_ACCESS_KEY_ID    - R2のアクセスキーID")
-        print("  R2_SECRET_ACCESS_KEY - R2のシークレットアクセスキー")
-        print("  R2_BUCKET_NAME      - バケット名")
-        sys.exit(1)
-
-    r2_key = sys.argv[1]
-    start_dt = parse_date(sys.argv[2])
-    end_dt = parse_date(sys.argv[3]) + timedelta(days=1)  # 終了日の翌日0時まで
-
-    generate_hourly_for_range(r2_key, start_dt, end_dt)
+    parser = argparse.ArgumentParser(
+        description="Clio API を使って hourly キャッシュを生成し、R2 に保存する",
+        epilog=(
+            "例:\n"
+            "  python generate_hourly_clio.py ledger_cache_2025.json 2025-01-01 2025-12-31\n"
+            "\n"
+            "環境変数:\n"
+            "  R2_ACCOUNT_ID       - CloudflareアカウントID\n"
+            "  R2_ACCESS_KEY_ID    - R2のアクセスキーID\n"
+            "  R2_SECRET_ACCESS_KEY - R2のシークレットアクセスキー\n"
+            "  R2_BUCKET_NAME      - バケット名"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("r2_key", help="R2 上のオブジェクトキー")
+    parser.add_argument("start_date", help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("end_date", help="終了日 (YYYY-MM-DD)")
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="JSON に加えて保存する形式（msgpack / parquet、既定: json のみ）",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        help="各日 0:00 だけを Clio で引き、間の時刻は線形補間で埋める（問い合わせ数が約 1/24）",
+    )
+    args = parser.parse_args()
+
+    start_dt = parse_date(args.start_date)
+    end_dt = parse_date(args.end_date) + timedelta(days=1)  # 終了日の翌日0時まで
+
+    generate_hourly_for_range(
+        args.r2_key,
+        start_dt,
+        end_dt,
+        output_format=args.output_format,
+        interpolate=args.interpolate,
+    )
@@ -8,22 +8,89 @@ Clio サーバーの ledger_index コマンドを使って、
 指定した日付範囲の 1時間ごとの ledger_index を取得し、
 ローカルファイルに保存します。
 
+途中で止まっても取得済みの分を失わないよう、追加したエントリは
+<path>.ndjson に追記ログとして書き出し、--checkpoint-every 件ごとに
+本体の JSON へまとめて保存する。次回起動時に追記ログが残っていれば
+本体にマージしてから処理を続ける。
+
 使い方:
   python generate_hourly_clio_local.py ledger_cache_2025.json 2025-01-01 2025-12-31
+  python generate_hourly_clio_local.py ledger_cache_2025.json 2025-01-01 2025-12-31 --checkpoint-every 1000
+  python generate_hourly_clio_local.py ledger_cache_2025.json 2025-01-01 2025-12-31 --format parquet
 """
 
+import argparse
 import json
 import os
 import re
-import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 
 import requests
 
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準 json で代替
+    orjson = None
+
 # ====== Clio 設定 ======
 CLIO_URL = "https://s1.ripple.com:51234/"
+CLIO_MAX_WORKERS = 8  # 同時に投げるリクエスト数
+CLIO_RATE_PER_SEC = 5.0  # 1秒あたりの最大リクエスト数（レート制限対策）
+
+# ====== 保存設定 ======
+DEFAULT_CHECKPOINT_EVERY = 500  # この件数を追加するごとに本体の JSON を保存する
+
+# Clio への接続は keep-alive で使い回す（リクエストごとの TLS ハンドシェイクを避ける）
+_SESSION = requests.Session()
+
+# ====== JSON 出力設定 ======
+# 既定はコンパクト出力。デバッグ用に人が読める形にしたい場合は PRETTY_JSON=1 を設定する
+PRETTY_JSON = bool(os.environ.get("PRETTY_JSON"))
+_JSON_FORMAT = {"indent": 2} if PRETTY_JSON else {"separators": (",", ":")}
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    if PRETTY_JSON:
+        _ORJSON_OPTIONS |= orjson.OPT_INDENT_2
+
+
+class RateLimiter:
+    """
+    トークンバケット型のレート制限。
+    トークンが尽きたときだけ待つので、サーバーに余裕がある間はまとめて投げられる。
+    reserve() が待ち秒数を返すので、スレッドからも asyncio からも使える。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """トークンを1つ予約し、それが使えるようになるまでの待ち秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+
+_clio_limiter = RateLimiter(CLIO_RATE_PER_SEC, burst=CLIO_MAX_WORKERS)
+
+
+def hour_key(dt: datetime) -> str:
+    """hourly のキー（2025-01-01T00:00:00Z 形式）。strftime より速いので f-string で組み立てる"""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}Z"
 
 
 def clio_ledger_index(dt: datetime) -> dict | None:
@@ -39,7 +106,7 @@ def clio_ledger_index(dt: datetime) -> dict | None:
         }
         または None（未来の日時など）
     """
-    date_str = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    date_str = hour_key(dt)
     
     payload = {
         "method": "ledger_index",
@@ -48,10 +115,10 @@ def clio_ledger_index(dt: datetime) -> dict | None:
         }]
     }
     
-    response = requests.post(CLIO_URL, json=payload, timeout=30)
+    response = _SESSION.post(CLIO_URL, json=payload, timeout=30)
     response.raise_for_status()
     
-    data = response.json()
+    data = orjson.loads(response.content) if orjson is not None else response.json()
     
     if "result" not in data:
         return None
@@ -67,9 +134,67 @@ def clio_ledger_index(dt: datetime) -> dict | None:
     return result
 
 
+def fetch_ledger_indexes(targets: list[datetime]) -> dict[datetime, dict | None]:
+    """
+    targets の各時刻について clio_ledger_index をスレッドプールで並列に呼び出す。
+
+    Returns:
+        { 時刻: clio_ledger_index の戻り値 }
+        エラーになった時刻は含めない（ログのみ出力）
+    """
+    results: dict[datetime, dict | None] = {}
+    total = len(targets)
+
+    def fetch(dt: datetime) -> dict | None:
+        _clio_limiter.acquire()
+        return clio_ledger_index(dt)
+
+    with ThreadPoolExecutor(max_workers=CLIO_MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch, dt): dt for dt in targets}
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            if future.cancelled():
+                continue
+
+            dt = futures[future]
+            key_iso = hour_key(dt)
+
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{done}/{total}] {key_iso}: ✗ エラー: {e}")
+                continue
+
+            results[dt] = result
+
+            if result is None:
+                print(f"[{done}/{total}] {key_iso}: ⏭ データなし")
+                # これより後の時刻もデータなし確定なので、未着手のものは取り消す
+                for other, other_dt in futures.items():
+                    if other_dt > dt:
+                        other.cancel()
+                continue
+
+            print(f"[{done}/{total}] {key_iso}: ✓ ledger={result['ledger_index']}, closed={result['closed']}")
+
+    return results
+
+
+_YEAR_RE = re.compile(r"(\d{4})")
+
+
+def _is_ymd(k: str) -> bool:
+    """k が YYYY-MM-DD 形式か（旧フォーマットの移行で全キーに使うので、正規表現を使わずに判定する）"""
+    return (
+        len(k) == 10 and k[4] == "-" and k[7] == "-"
+        and k[:4].isdigit() and k[5:7].isdigit() and k[8:].isdigit()
+    )
+
+
+@lru_cache(maxsize=128)
 def infer_year_from_path(path: str) -> int | None:
     """パスから年を推測"""
-    m = re.search(r"(\d{4})", os.path.basename(path))
+    m = _YEAR_RE.search(os.path.basename(path))
     if m:
         return int(m.group(1))
     return None
@@ -99,8 +224,11 @@ def load_cache(path: str) -> dict:
         print(f"{path} が存在しないため、新規作成として扱います。")
         return make_empty_cache(path)
     
-    with open(path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
+    if orjson is not None:
+        raw = orjson.loads(Path(path).read_bytes())
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
     
     print(f"ローカルから読み込み完了: {path}")
 
@@ -112,57 +240,325 @@ def load_cache(path: str) -> dict:
     cache = make_empty_cache(path)
     if isinstance(raw, dict):
         for k, v in raw.items():
-            if isinstance(k, str) and re.match(r"^\d{4}-\d{2}-\d{2}$", k):
+            if isinstance(k, str) and _is_ymd(k):
                 cache["daily"][k] = v
     return cache
 
 
-def save_cache(path: str, cache: dict) -> None:
-    """キャッシュをローカルに保存"""
+OUTPUT_FORMATS = ("json", "msgpack", "parquet")
+
+
+def sidecar_name(name: str, suffix: str) -> str:
+    """ledger_cache_2025.json → ledger_cache_2025{suffix}"""
+    base = name[: -len(".json")] if name.endswith(".json") else name
+    return f"{base}{suffix}"
+
+
+def encode_sidecars(out: dict, output_format: str) -> list[tuple[str, bytes, str]]:
+    """
+    JSON と並べて置くバイナリ形式のデータを作る。
+    戻り値は (ファイル名の末尾, 中身, Content-Type) のリスト（json なら空）。
+
+    - msgpack: JSON と同じ構造をそのまま packb したもの
+    - parquet: daily / hourly をそれぞれ (key, ledger_index, close_time, precision) の表にしたもの
+      （補間値は close_time が null）
+    """
+    if output_format == "msgpack":
+        import msgpack  # 使うときだけ読み込む（任意の依存）
+
+        return [(".msgpack", msgpack.packb(out, use_bin_type=True), "application/msgpack")]
+
+    if output_format == "parquet":
+        import pyarrow as pa  # 使うときだけ読み込む（任意の依存）
+        import pyarrow.parquet as pq
+
+        files = []
+        for section in ("daily", "hourly"):
+            entries = out.get(section, {})
+            keys = sorted(entries)
+            table = pa.table({
+                "key": pa.array(keys, type=pa.string()),
+                "ledger_index": pa.array([int(entries[k]["ledger_index"]) for k in keys], type=pa.int64()),
+                "close_time": pa.array([entries[k].get("close_time") for k in keys], type=pa.string()),
+                "precision": pa.array([entries[k].get("precision") for k in keys], type=pa.string()),
+            })
+            buf = pa.BufferOutputStream()
+            pq.write_table(table, buf)
+            files.append((f"_{section}.parquet", buf.getvalue().to_pybytes(), "application/vnd.apache.parquet"))
+        return files
+
+    return []
+
+
+def save_cache(path: str, cache: dict, output_format: str = "json") -> None:
+    """
+    キャッシュをローカルに保存
+
+    output_format が msgpack / parquet の場合は、JSON に加えて
+    同じ内容のバイナリ形式を隣のファイルにも保存する。
+    """
     meta = cache.get("meta", {})
     daily = cache.get("daily", {})
     hourly = cache.get("hourly", {})
 
-    daily_sorted = {k: daily[k] for k in sorted(daily.keys())}
-    hourly_sorted = {k: hourly[k] for k in sorted(hourly.keys())}
+    # ディレクトリがなければ作成
+    parent = Path(path).parent
+    if parent and not parent.exists():
+        parent.mkdir(parents=True, exist_ok=True)
+
+    # 書き込み途中で止まっても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+    tmp_path = f"{path}.tmp"
 
+    # キーのソートはエンコーダ側（orjson の OPT_SORT_KEYS / json の sort_keys）に任せる
     out = {
         "meta": meta,
-        "daily": daily_sorted,
-        "hourly": hourly_sorted,
+        "daily": daily,
+        "hourly": hourly,
     }
 
-    # ディレクトリがなければ作成
-    parent = Path(path).parent
-    if parent and not parent.exists():
-        parent.mkdir(parents=True, exist_ok=True)
+    if orjson is not None:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(out, option=_ORJSON_OPTIONS))
+    else:
+        # json.dump は細切れに write するので、文字列にしてから一度で書き込む
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(out, ensure_ascii=False, sort_keys=True, **_JSON_FORMAT))
+
+    os.replace(tmp_path, path)
+
+    print(f"ローカルに保存完了: {path} (daily={len(daily)}, hourly={len(hourly)})")
+
+    for suffix, data, _ in encode_sidecars(out, output_format):
+        sidecar_path = sidecar_name(path, suffix)
+        with open(f"{sidecar_path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{sidecar_path}.tmp", sidecar_path)
+        print(f"ローカルに保存完了: {sidecar_path} ({len(data)} bytes)")
+
+
+def parse_iso_time(s: str) -> datetime:
+    """ISO8601 文字列（末尾 Z も可）→ datetime (UTC)"""
+    return datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def interpolate_ledger_index(
+    a_index: int,
+    a_time: datetime,
+    b_index: int,
+    b_time: datetime,
+    t: datetime,
+) -> int:
+    """2つのアンカー (a, b) の間で、時刻 t の ledger_index を線形補間する"""
+    span = (b_time - a_time).total_seconds()
+    if span <= 0:
+        return a_index
+    return a_index + round((b_index - a_index) * (t - a_time).total_seconds() / span)
+
+
+def interpolate_missing(
+    missing: list[tuple[str, datetime]],
+    hourly: dict,
+) -> tuple[dict[str, dict], list[tuple[str, datetime]]]:
+    """
+    各日の 0:00 をアンカーとして Clio で引き、その間の時刻は線形補間で埋める。
+    XRPL のレジャーはほぼ一定間隔で閉じるので、1日あたりの問い合わせが 24回 → 1回で済む。
+
+    補間したエントリには "precision": "interpolated" を付け、close_time は入れない
+    （実際に閉じたレジャーの時刻ではないため）。
+    --interpolate なしで実行し直すと、Clio の正確な値で置き換えられる。
+
+    Returns:
+        (補間で埋めたエントリ {key_iso: entry}, Clio で個別に引く必要がある (key_iso, 時刻) のリスト)
+        翌日のアンカーがまだ無い日（当日など）は個別に引く側に回す。
+    """
+    anchor_times: set[datetime] = set()
+    for _, cur in missing:
+        day = cur.replace(hour=0, minute=0, second=0, microsecond=0)
+        anchor_times.add(day)
+        anchor_times.add(day + timedelta(days=1))
+
+    # アンカー: 時刻 → (ledger_index, close_time, close_time の元の文字列)
+    anchors: dict[datetime, tuple[int, datetime, str]] = {}
+    to_fetch: list[datetime] = []
+    for t in sorted(anchor_times):
+        entry = hourly.get(hour_key(t))
+        if entry and entry.get("precision") != "interpolated":
+            anchors[t] = (int(entry["ledger_index"]), parse_iso_time(entry["close_time"]), entry["close_time"])
+        else:
+            to_fetch.append(t)
+
+    print(f"アンカー（各日 0:00）{len(anchor_times)} 件、うち Clio 問い合わせ {len(to_fetch)} 件")
+
+    for t, result in fetch_ledger_indexes(to_fetch).items():
+        if result is None:
+            continue
+        try:
+            anchors[t] = (int(result["ledger_index"]), parse_iso_time(result["closed"]), result["closed"])
+        except ValueError:
+            print(f"  アンカー {t} の close_time を解釈できないため使わない: {result['closed']}")
+
+    resolved: dict[str, dict] = {}
+    exact: list[tuple[str, datetime]] = []
+
+    for key_iso, cur in missing:
+        day = cur.replace(hour=0, minute=0, second=0, microsecond=0)
+        a = anchors.get(day)
+        b = anchors.get(day + timedelta(days=1))
+
+        if cur == day and a is not None:
+            # アンカーそのものは Clio の値をそのまま使う
+            resolved[key_iso] = {"ledger_index": a[0], "close_time": a[2]}
+        elif a is not None and b is not None:
+            resolved[key_iso] = {
+                "ledger_index": interpolate_ledger_index(a[0], a[1], b[0], b[1], cur),
+                "precision": "interpolated",
+            }
+        else:
+            exact.append((key_iso, cur))
+
+    return resolved, exact
+
+
+def journal_path(path: str) -> str:
+    """追記ログ（NDJSON）のパス"""
+    return f"{path}.ndjson"
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
 
-    print(f"ローカルに保存完了: {path} (daily={len(daily_sorted)}, hourly={len(hourly_sorted)})")
+def append_journal(f, entries: list[tuple[str, dict]]) -> None:
+    """hourly エントリを追記ログに書き出し、ディスクまで確実に反映させる"""
+    for key_iso, entry in entries:
+        record = {"key": key_iso, "entry": entry}
+        if orjson is not None:
+            f.write(orjson.dumps(record) + b"\n")
+        else:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+    f.flush()
+    os.fsync(f.fileno())
 
 
-def generate_hourly_for_range(path: str, dt_start: datetime, dt_end: datetime) -> None:
+def replay_journal(path: str, cache: dict) -> int:
+    """
+    前回の実行で保存されずに残った追記ログを hourly にマージする。
+    マージした件数を返す。
+    """
+    jpath = Path(journal_path(path))
+    if not jpath.exists():
+        return 0
+
+    hourly = cache.setdefault("hourly", {})
+    merged = 0
+
+    with open(jpath, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = orjson.loads(line) if orjson is not None else json.loads(line)
+            except ValueError:
+                # 書き込み途中で止まった最終行は捨てる
+                break
+            hourly[record["key"]] = record["entry"]
+            merged += 1
+
+    return merged
+
+
+def count_available_hours(dt_start: datetime, total_hours: int) -> int:
+    """
+    dt_start から total_hours 時間のうち、先頭から何時間分 Clio にレジャーがあるかを返す。
+    まず最後の時刻だけを問い合わせ、データがあれば全部ある。
+    無ければ（lgrNotFound）二分探索で境目を探すので、問い合わせは log2(N) 回で済む。
+    """
+    def available(i: int) -> bool:
+        _clio_limiter.acquire()
+        return clio_ledger_index(dt_start + timedelta(hours=i)) is not None
+
+    if available(total_hours - 1):
+        return total_hours
+
+    # lo より前はデータあり、hi はデータなしが確定している
+    lo, hi = 0, total_hours - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if available(mid):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def generate_hourly_for_range(
+    path: str,
+    dt_start: datetime,
+    dt_end: datetime,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    output_format: str = "json",
+    interpolate: bool = False,
+) -> None:
     """
     Clio API を使って hourly キャッシュを生成
+
+    interpolate=True なら各日 0:00 だけを Clio で引き、残りは線形補間で埋める
+    （interpolate_missing 参照）。False のときは補間済みのエントリも引き直す。
+
+    追加したエントリはその都度追記ログに書き、checkpoint_every 件たまるごとに
+    本体の JSON を保存する（年単位の実行でも全体の書き直しは数回で済む）。
     """
     cache = load_cache(path)
     hourly: dict = cache.setdefault("hourly", {})
 
+    recovered = replay_journal(path, cache)
+    if recovered > 0:
+        print(f"前回の追記ログから {recovered} 件を復元しました: {journal_path(path)}")
+
     # 現在時刻（UTC）を取得し、未来は処理しない
     now = datetime.now(timezone.utc)
     effective_end = min(dt_end, now)
 
-    cur = dt_start
     total_hours = int(((effective_end - dt_start).total_seconds() // 3600) + 1)
     if total_hours < 1:
         print("処理対象の時間がありません（開始時刻が未来）")
         return
 
-    processed = 0
+    # 対象時刻のキーを先にまとめて作り、既存のものを一度に取り除く
+    # hourly のキー: 2025-01-01T00:00:00Z 形式
+    wanted = {}
+    for i in range(total_hours):
+        cur = dt_start + timedelta(hours=i)
+        wanted[hour_key(cur)] = cur
+    # dict のキービュー同士の集合演算で不足分を求める（ISO 形式なのでソートすれば時刻順）
+    missing_keys = wanted.keys() - hourly.keys()
+    if not interpolate:
+        missing_keys |= {
+            key_iso for key_iso in wanted.keys() & hourly.keys()
+            if hourly[key_iso].get("precision") == "interpolated"
+        }
+    missing = [(key_iso, wanted[key_iso]) for key_iso in sorted(missing_keys)]
+
+    # 不足が無ければ Clio には問い合わせない（追記ログから復元した分があれば保存だけする）
+    if not missing and recovered == 0:
+        print(f"{dt_start} ～ {effective_end} の hourly はすべて揃っているため処理なし")
+        return
+
+    # 末尾にデータの無い時刻があれば、1時間ずつ問い合わせる前に範囲を縮めておく
+    if missing:
+        try:
+            available_hours = count_available_hours(dt_start, total_hours)
+        except Exception as e:
+            print(f"データの有無の事前確認に失敗したため、範囲を縮めずに続けます: {e}")
+            available_hours = total_hours
+        if available_hours < 1:
+            print(f"{dt_start} 以降はデータなしのため処理対象の時間がありません")
+            return
+        if available_hours < total_hours:
+            total_hours = available_hours
+            effective_end = dt_start + timedelta(hours=total_hours - 1)
+            missing = [(key_iso, cur) for key_iso, cur in missing if cur <= effective_end]
+            print(f"{effective_end} より後はデータなしのため、そこまでを処理します")
+
+    processed = total_hours
     added = 0
-    skipped_existing = 0
 
     print(f"{dt_start} ～ {effective_end} の hourly を {path} に生成します。")
     if dt_end > now:
@@ -170,50 +566,77 @@ def generate_hourly_for_range(path: str, dt_start: datetime, dt_end: datetime) -
     print(f"Clio サーバー: {CLIO_URL}")
     print("-" * 60)
 
-    prev_date = None
-
-    while cur <= effective_end:
-        processed += 1
-        current_date = cur.date()
-        
-        # hourly のキー: 2025-01-01T00:00:00Z 形式
-        key_iso = cur.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        if prev_date is None or current_date != prev_date:
-            if prev_date is not None:
-                print(f"日付が変わったため保存: {prev_date}")
-                save_cache(path, cache)
-            prev_date = current_date
-
-        if key_iso in hourly:
-            print(f"[{processed}/{total_hours}] {key_iso}: 既存 → スキップ")
-            skipped_existing += 1
-            cur += timedelta(hours=1)
-            continue
+    skipped_existing = total_hours - len(missing)
 
-        print(f"[{processed}/{total_hours}] {key_iso}: Clio 問い合わせ ... ", end="", flush=True)
+    # 日付ごとにまとめる
+    missing_by_date: dict = {}
+    for key_iso, cur in missing:
+        missing_by_date.setdefault(cur.date(), []).append((key_iso, cur))
 
-        try:
-            result = clio_ledger_index(cur)
-            
-            if result is None:
-                print(f"⏭ データなし（終了）")
+    print(f"既存 {skipped_existing} 件、不足 {len(missing)} 件（並列数 {CLIO_MAX_WORKERS}）")
+
+    if interpolate:
+        resolved, exact = interpolate_missing(missing, hourly)
+        print(f"補間で {len(resolved)} 件を埋め、残り {len(exact)} 件を Clio に問い合わせます")
+    else:
+        resolved = {}
+
+    # 1日分ずつ並列に取得し、追加分は追記ログへ、一定件数ごとに本体へ保存する
+    unsaved = recovered
+    reached_end = False
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    journal = open(journal_path(path), "ab")
+
+    try:
+        for current_date, day_missing in missing_by_date.items():
+            results = fetch_ledger_indexes([cur for key_iso, cur in day_missing if key_iso not in resolved])
+
+            # 時刻順にマージし、最初の「データなし」以降は打ち切る
+            new_entries: list[tuple[str, dict]] = []
+            for key_iso, cur in day_missing:
+                if key_iso in resolved:
+                    hourly[key_iso] = resolved[key_iso]
+                    new_entries.append((key_iso, resolved[key_iso]))
+                    continue
+
+                if cur not in results:
+                    continue  # エラー（ログ出力済み）
+
+                result = results[cur]
+                if result is None:
+                    print(f"{key_iso} 以降はデータなしのため終了")
+                    reached_end = True
+                    break
+
+                entry = {
+                    "ledger_index": result["ledger_index"],
+                    "close_time": result["closed"],
+                }
+                hourly[key_iso] = entry
+                new_entries.append((key_iso, entry))
+
+            if new_entries:
+                append_journal(journal, new_entries)
+                added += len(new_entries)
+                unsaved += len(new_entries)
+
+            if reached_end:
                 break
-            
-            hourly[key_iso] = {
-                "ledger_index": result["ledger_index"],
-                "close_time": result["closed"],
-            }
-            added += 1
-            print(f"✓ ledger={result['ledger_index']}, closed={result['closed']}")
-            
-            time.sleep(0.2)  # レート制限対策
-            
-        except Exception as e:
-            print(f"✗ エラー: {e}")
-            time.sleep(1)
 
-        cur += timedelta(hours=1)
+            if unsaved >= checkpoint_every:
+                print(f"{current_date} までの {unsaved} 件を保存（チェックポイント）")
+                save_cache(path, cache, output_format)
+                unsaved = 0
+                journal.seek(0)
+                journal.truncate()
+    finally:
+        journal.close()
+        # 中断（Ctrl+C など）された場合も、取得済みの分は保存しておく
+        if unsaved > 0:
+            save_cache(path, cache, output_format)
+
+    # 本体に反映済みなので追記ログは不要
+    Path(journal_path(path)).unlink(missing_ok=True)
 
     print()
     print("=" * 60)
@@ -222,9 +645,7 @@ def generate_hourly_for_range(path: str, dt_start: datetime, dt_end: datetime) -
     print(f"  追加: {added}")
     print(f"  既存スキップ: {skipped_existing}")
 
-    if added > 0:
-        save_cache(path, cache)
-    else:
+    if added == 0 and recovered == 0:
         print("変更なしのため保存スキップ")
 
 
@@ -233,16 +654,47 @@ def parse_date(s: str) -> datetime:
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("使い方:")
-        print("  python generate_hourly_clio_local.py <path> <start_date> <end_date>")
-        print("例:")
-        print("  python generate_hourly_clio_local.py ledger_cache_2025.json 2025-01-01 2025-12-31")
-        print("  python generate_hourly_clio_local.py cache/ledger_cache_2024.json 2024-01-01 2024-12-31")
-        sys.exit(1)
-
-    file_path = sys.argv[1]
-    start_dt = parse_date(sys.argv[2])
-    end_dt = parse_date(sys.argv[3]) + timedelta(days=1)  # 終了日の翌日0時まで
-
-    generate_hourly_for_range(file_path, start_dt, end_dt)
+    parser = argparse.ArgumentParser(
+        description="Clio API を使って hourly キャッシュをローカルファイルに生成する",
+        epilog=(
+            "例:\n"
+            "  python generate_hourly_clio_local.py ledger_cache_2025.json 2025-01-01 2025-12-31\n"
+            "  python generate_hourly_clio_local.py cache/ledger_cache_2024.json 2024-01-01 2024-12-31"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("path", help="キャッシュファイルのパス")
+    parser.add_argument("start_date", help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("end_date", help="終了日 (YYYY-MM-DD)")
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=DEFAULT_CHECKPOINT_EVERY,
+        metavar="N",
+        help=f"N 件追加するごとに本体の JSON を保存する（既定: {DEFAULT_CHECKPOINT_EVERY}）",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="JSON に加えて保存する形式（msgpack / parquet、既定: json のみ）",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        help="各日 0:00 だけを Clio で引き、間の時刻は線形補間で埋める（問い合わせ数が約 1/24）",
+    )
+    args = parser.parse_args()
+
+    start_dt = parse_date(args.start_date)
+    end_dt = parse_date(args.end_date) + timedelta(days=1)  # 終了日の翌日0時まで
+
+    generate_hourly_for_range(
+        args.path,
+        start_dt,
+        end_dt,
+        checkpoint_every=args.checkpoint_every,
+        output_format=args.output_format,
+        interpolate=args.interpolate,
+    )
@@ -13,108 +13,371 @@ hourly セクションを埋める。
 - daily は「ラフな1日1本のレジャー」であり、その日の最終レジャーとは限らない
 - ただし「前日の daily と翌日の daily の間にある」ことは保証される前提とする
 - 各時間の hourly は、
-    - 下限 = max(前日の daily ledger_index, 直前の hourly ledger_index)
+    - 下限 = max(前日の daily ledger_index, 直前の既存 hourly ledger_index)
     - 上限 = 翌日の daily ledger_index（または十分先）
   とするインデックス範囲内で二分探索し、
   「close_time >= target_dt」を満たす最小の ledger_index とする
 - 精緻条件は「target_dt と同時刻のレジャー」か「その直後の最初のレジャー」のみに限定
-- 変更があった場合のみ、最後に1回保存
+- 1日分の時間は asyncio で同時に探索する（同時リクエスト数は REFINE_CONCURRENCY まで）
+- 変更があった場合のみ保存（DEFAULT_CHECKPOINT_EVERY 本ごとの途中保存と、最後に1回）
 
 環境変数:
   R2_ACCOUNT_ID: CloudflareアカウントID
   R2_ACCESS_KEY_ID: R2のアクセスキーID
   R2_SECRET_ACCESS_KEY: R2のシークレットアクセスキー
   R2_BUCKET_NAME: バケット名
+  LEDGER_TIME_DB: （任意）取得済みの ledger close_time を保存する SQLite ファイル。
+                  指定すると実行をまたいで同じレジャーを問い合わせ直さない
+  LOGLEVEL: （任意）ログの詳細度（既定 INFO）。DEBUG で探索の途中経過、WARNING で失敗だけを出す
 
 使い方:
   python refine_hourly_ledger_cache3.py ledger_cache_2025.json 2025-01-01 2025-12-31
+  python refine_hourly_ledger_cache3.py ledger_cache_2025.json 2025-01-01 2025-12-31 --use-clio
+
+--use-clio を付けると、まず Clio の ledger_index（日時 → ledger_index）で直接引き、
+隣のレジャーを1本だけ確認して条件を満たせばそれを使う（満たさなければ従来の二分探索）。
 """
 
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import sqlite3
 import sys
+import threading
 import time
-from datetime import datetime, timedelta, timezone
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal
 
-from xrpl.models.requests import Ledger
+import httpx
+from xrpl.asyncio.clients.exceptions import XRPLRequestFailureException
+from xrpl.models.requests import GenericRequest, Ledger
 
 # R2対応版の append_rough_ledger_cache.py から共通処理をインポート
 from append_rough_ledger_cache_r2 import (
     load_cache,
     save_cache,
-    FutureLedgerError,
     ripple_time_to_datetime,
-    client,
+    date_key_of,
+    DailyEntry,
+    HourlyEntry,
+    JSON_RPC_URL,
+    PooledAsyncJsonRpcClient,
+    xrpl_limiter,
 )
 
+# 探索の途中経過は DEBUG、1時間ごとの結果は INFO で出す（LOGLEVEL 環境変数で切り替え）
+logger = logging.getLogger(__name__)
+
 # XRPL のジェネシスレジャー（これより前には遡れない）
 GENESIS_INDEX = 32570
 
+# --use-clio で使う Clio サーバー（ledger_index コマンドに対応しているもの）
+CLIO_URL = "https://s1.ripple.com:51234/"
+
+# 補間探索で推定位置を両端からこれ以上離す（端ばかり引いて縮まらないのを防ぐ）
+INTERPOLATION_MARGIN = 0.05
+# 補間が連続でこの回数、範囲を 25% 以上縮められなければ二分探索に切り替える
+INTERPOLATION_MAX_MISSES = 2
+
+# 二分探索に切り替えた後、範囲がこの本数より広ければ 1/4・1/2・3/4 の3点を同時に引く
+# （1往復で範囲が 1/4 になるので、往復回数がおよそ半分になる）
+QUARTILE_PROBE_MIN_SPAN = 1000
+
+# 最新 validated レジャー（対象期間の終わりと上限の補正用）を取り直す間隔（秒）
+LATEST_LEDGER_REFRESH = 300
+
+# この件数を追加するごとに R2 に保存する（途中で落ちても進捗を失わないように）
+DEFAULT_CHECKPOINT_EVERY = 500
+
+# 推定位置のレジャーが target_dt からこの秒数以内（後ろ側）なら、直前の1本だけ確かめて確定する
+# （レジャーの間隔は約 3.5 秒なので、ほぼ「同時刻か直後の最初のレジャー」になっている）
+SHORT_CIRCUIT_SECONDS = 4.0
+
+# 同時に投げるリクエスト数（公開ノードのレート制限に掛からない程度）
+REFINE_CONCURRENCY = 8
+
+# 通信エラー（タイムアウト・ノードのエラー応答など）で探索に失敗した時間を、やり直す回数と初回の待ち秒数
+NETWORK_MAX_RETRIES = 3
+NETWORK_RETRY_BACKOFF = 2.0
+
+# これらは「やり直せば通るかもしれない」失敗として扱う。それ以外の例外はバグなのでそのまま落とす
+NETWORK_ERRORS = (httpx.HTTPError, XRPLRequestFailureException)
+
+# 探索結果: (種別, ledger_index, close_time, メッセージ)。ledger_index と close_time は "ok" のときだけ入る
+#   ok           - 見つかった
+#   out_of_range - 探索範囲（前日～翌日の daily、上限は最新 validated レジャー）が target_dt を挟んでいない
+#   network      - レジャーを取得できなかった（NETWORK_MAX_RETRIES 回やり直しても）
+SearchResult = tuple[Literal["ok", "out_of_range", "network"], int | None, datetime | None, str]
+
+# 接続を使い回すクライアント（append_rough_ledger_cache_r2.PooledAsyncJsonRpcClient）
+async_client = PooledAsyncJsonRpcClient(JSON_RPC_URL)
+clio_client = PooledAsyncJsonRpcClient(CLIO_URL)
+
+# 実行中のイベントループで作る（refine_hourly_for_range 参照）。
+# 同じプロセスで複数の年を別スレッド（別のイベントループ）で回せるよう、ContextVar で持つ
+_rpc_semaphore: contextvars.ContextVar[asyncio.Semaphore] = contextvars.ContextVar("_rpc_semaphore")
+
+# (取得時刻 time.monotonic(), ledger_index, close_time)
+_latest_ledger: tuple[float, int, datetime] | None = None
+
+# 取得済みの close_time（ledger_index → close_time）。探索範囲が重なる時間どうしで使い回す
+LEDGER_TIME_DB = os.environ.get("LEDGER_TIME_DB", "")
+_ledger_times: dict[int, datetime] = {}
+# SQLite にまだ書いていない (ledger_index, close_time の UNIX 秒)
+_unsaved_ledger_times: list[tuple[int, int]] = []
+# update_ledger_cache.py は複数の年を別スレッドで回すので、_unsaved_ledger_times の読み書きと SQLite への書き込みはこれで守る
+_ledger_time_lock = threading.Lock()
+
+
+def load_ledger_time_db() -> None:
+    """LEDGER_TIME_DB が設定されていれば、保存済みの close_time を読み込む"""
+    if not LEDGER_TIME_DB:
+        return
+    with sqlite3.connect(LEDGER_TIME_DB) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS ledger_time (idx INTEGER PRIMARY KEY, close_time INTEGER)")
+        for idx, close_time in conn.execute("SELECT idx, close_time FROM ledger_time"):
+            _ledger_times[idx] = datetime.fromtimestamp(close_time, tz=timezone.utc)
+    print(f"{LEDGER_TIME_DB} から close_time を {len(_ledger_times)} 件読み込みました")
+
+
+def flush_ledger_time_db() -> None:
+    """新しく取得した close_time を LEDGER_TIME_DB にまとめて書き込む"""
+    if not LEDGER_TIME_DB:
+        return
+    with _ledger_time_lock:
+        if not _unsaved_ledger_times:
+            return
+        with sqlite3.connect(LEDGER_TIME_DB) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS ledger_time (idx INTEGER PRIMARY KEY, close_time INTEGER)")
+            conn.executemany("INSERT OR IGNORE INTO ledger_time (idx, close_time) VALUES (?, ?)", _unsaved_ledger_times)
+        # 書き込めたものだけ消す（失敗したら次回また書く）
+        _unsaved_ledger_times.clear()
+
+
+def load_entries(cache: dict) -> tuple[dict[str, DailyEntry], dict[str, HourlyEntry]]:
+    """
+    cache の daily / hourly を型付きのエントリに変換する（精緻化の間はこちらを読み書きする）。
+    ledger_index が数値にならない hourly は読み飛ばす（取り直して上書きされる）。
+    daily も解釈できない行は警告を出して読み飛ばす（その日はアンカーなし扱い）
+    """
+    daily = {}
+    for k, v in cache.setdefault("daily", {}).items():
+        try:
+            date.fromisoformat(k)  # split_daily で日付として並べるので、キーも確かめておく
+            daily[k] = DailyEntry.from_dict(v)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.warning("daily %s を解釈できないため使わない: %s: %s", k, type(e).__name__, e)
+    hourly = {}
+    for k, v in cache.setdefault("hourly", {}).items():
+        try:
+            hourly[k] = HourlyEntry.from_dict(v)
+        except (KeyError, TypeError, ValueError):
+            pass
+    return daily, hourly
+
+
+def split_daily(daily: dict[str, DailyEntry]) -> tuple[list[date], list[int]]:
+    """
+    daily を日付順に並べ、日付のリストと ledger_index のリストに分ける。
+    日ごとの前後の daily は bisect で位置を引き、キー文字列を組み立てずに参照する
+    """
+    pairs = sorted((date.fromisoformat(k), entry.ledger_index) for k, entry in daily.items())
+    return [d for d, _ in pairs], [idx for _, idx in pairs]
+
+
+def save_hourly(key: str, cache: dict, hourly: dict[str, HourlyEntry]) -> None:
+    """型付きの hourly を dict に戻して cache に書き込み、R2 に保存する"""
+    cache["hourly"].update({k: entry.to_dict() for k, entry in hourly.items()})
+    save_cache(key, cache)
+
+
+async def rpc_request(rpc_client: PooledAsyncJsonRpcClient, request):
+    """
+    レート制限（xrpl_limiter のトークンバケット）を掛け、
+    同時リクエスト数を REFINE_CONCURRENCY までに抑えて request を投げる
+    """
+    await asyncio.sleep(xrpl_limiter.reserve())
+    async with _rpc_semaphore.get():
+        return await rpc_client.request(request)
+
+
+async def get_ledger_header(index: int | str) -> tuple[int, datetime]:
+    """指定 index（"validated" も可）の (ledger_index, close_time) を返すヘルパ。"""
+    if index in _ledger_times:
+        return index, _ledger_times[index]
+
+    response = await rpc_request(async_client, Ledger(ledger_index=index, transactions=False, expand=False))
+    if not response.is_successful():
+        raise XRPLRequestFailureException(response.result)
+    res = response.result
+    ledger_index = int(res["ledger_index"])
+    close_time = ripple_time_to_datetime(res["ledger"]["close_time"])
 
-def get_ledger_time(index: int) -> datetime:
+    if ledger_index not in _ledger_times:
+        _ledger_times[ledger_index] = close_time
+        with _ledger_time_lock:
+            _unsaved_ledger_times.append((ledger_index, int(close_time.timestamp())))
+    return ledger_index, close_time
+
+
+async def get_ledger_time(index: int) -> datetime:
     """指定 index の ledger close_time を datetime で返すヘルパ。"""
-    res = client.request(Ledger(ledger_index=index, expand=True)).result
-    return ripple_time_to_datetime(res["ledger"]["close_time"])
+    return (await get_ledger_header(index))[1]
+
+
+async def get_latest_ledger() -> tuple[int, datetime]:
+    """
+    最新 validated レジャーの (ledger_index, close_time) を返す。
+    LATEST_LEDGER_REFRESH 秒以内に取得済みならそれを使い回す。
+    """
+    global _latest_ledger
+    now = time.monotonic()
+    if _latest_ledger is None or now - _latest_ledger[0] >= LATEST_LEDGER_REFRESH:
+        latest_index, latest_time = await get_ledger_header("validated")
+        _latest_ledger = (now, latest_index, latest_time)
+    return _latest_ledger[1], _latest_ledger[2]
 
 
-def find_ledger_between(
+async def get_ledger_times_batch(indices: list[int | str]) -> dict[int | str, tuple[int, datetime]]:
+    """
+    複数のレジャーをまとめて問い合わせ、{指定した index: (ledger_index, close_time)} を返す。
+    rippled の JSON-RPC は1リクエスト1コマンドなので、同時に投げて
+    待ち時間を1往復分にまとめる。通信エラー（NETWORK_ERRORS）で取得できなかったものは含めない。
+    それ以外の例外（応答の形が変わった等のバグ）はそのまま送出する。
+    """
+    indices = list(dict.fromkeys(indices))
+    headers = await asyncio.gather(*(get_ledger_header(index) for index in indices), return_exceptions=True)
+    for header in headers:
+        if isinstance(header, BaseException) and not isinstance(header, NETWORK_ERRORS):
+            raise header
+    return {
+        index: header
+        for index, header in zip(indices, headers)
+        if not isinstance(header, NETWORK_ERRORS)
+    }
+
+
+async def find_ledger_between(
     target_dt: datetime,
     lo_index: int,
     hi_index: int,
-) -> tuple[int, datetime]:
+    latest: tuple[int, datetime],
+) -> SearchResult:
     """
     [lo_index, hi_index] 範囲内で二分探索し、
 
       - close_time >= target_dt
 
-    を満たす「最小の ledger_index」を返す。
+    を満たす「最小の ledger_index」を ("ok", ledger_index, close_time, "") で返す。
+    見つからないときは種別とメッセージだけを返す（SearchResult 参照）。
+    通信エラー（NETWORK_ERRORS）はそのまま送出する（refine_hour でやり直す）。
+    latest は最新 validated レジャーの (ledger_index, close_time)（get_latest_ledger）。
     """
+    # 複数の時間を同時に探索するので、ログには対象時刻を付ける
+    tag = target_dt.strftime("%H:%M")
 
-    # 最新レジャー情報（未来チェックと上限補正用）
-    latest = client.request(Ledger(ledger_index="validated", expand=True)).result
-    latest_index = int(latest["ledger_index"])
-    latest_time = ripple_time_to_datetime(latest["ledger"]["close_time"])
+    lo_index = max(lo_index, GENESIS_INDEX)
 
-    if target_dt > latest_time:
-        raise FutureLedgerError(
-            f"target datetime {target_dt.isoformat()} is newer than latest ledger close_time {latest_time.isoformat()}"
-        )
+    latest_index, latest_time = latest
 
-    # 範囲をクランプ
-    lo_index = max(lo_index, GENESIS_INDEX)
-    hi_index = min(hi_index, latest_index)
+    # ---- 両端を1往復で取得 ----
+    headers = await get_ledger_times_batch([lo_index, min(hi_index, latest_index)])
 
-    # ---- 両端の通信（lo / hi） ----
-    lo_time = get_ledger_time(lo_index)
+    if lo_index not in headers:
+        return "network", None, None, f"failed to fetch ledger {lo_index}"
+    lo_time = headers[lo_index][1]
     diff_lo = (lo_time - target_dt).total_seconds()
-    print(f"    ↳ init: ledger={lo_index}, close_time={lo_time}, diff={diff_lo:.1f}s")
+    logger.debug("    ↳ %s init: ledger=%s, close_time=%s, diff=%.1fs", tag, lo_index, lo_time, diff_lo)
 
-    hi_time = get_ledger_time(hi_index)
+    # 上限は最新レジャーでクランプ（hi がまだ無いレジャーなら最新レジャーを使う）
+    if hi_index >= latest_index:
+        hi_index, hi_time = latest_index, latest_time
+    elif hi_index in headers:
+        hi_time = headers[hi_index][1]
+    else:
+        return "network", None, None, f"failed to fetch ledger {hi_index}"
     diff_hi = (hi_time - target_dt).total_seconds()
-    print(f"    ↳ init: ledger={hi_index}, close_time={hi_time}, diff={diff_hi:.1f}s")
+    logger.debug("    ↳ %s init: ledger=%s, close_time=%s, diff=%.1fs", tag, hi_index, hi_time, diff_hi)
 
     # target が範囲外ならエラー
     if target_dt < lo_time or target_dt > hi_time:
-        raise RuntimeError(
+        return (
+            "out_of_range", None, None,
             f"target {target_dt.isoformat()} is not bracketed by "
-            f"lo({lo_index}, {lo_time.isoformat()}) and hi({hi_index}, {hi_time.isoformat()})"
+            f"lo({lo_index}, {lo_time.isoformat()}) and hi({hi_index}, {hi_time.isoformat()})",
         )
 
     iter_count = 0
 
-    # ---- 二分探索 ----
+    # ---- 補間探索 ----
+    # close_time はほぼ一定間隔（約 3.5 秒/レジャー）で進むので、時刻の比率で位置を推定すると
+    # 数回で収束する。推定が外れ続けたら二分探索に切り替える
+    use_interpolation = True
+    misses = 0
+
     while lo_index + 1 < hi_index:
-        mid = (lo_index + hi_index) // 2
-        mid_time = get_ledger_time(mid)
+        span = hi_index - lo_index
+
+        if not use_interpolation and span > QUARTILE_PROBE_MIN_SPAN:
+            probes = [lo_index + r * span // 4 for r in (1, 2, 3)]
+            headers = await get_ledger_times_batch(probes)
+            iter_count += 1
+            for probe in probes:
+                if probe not in headers:
+                    return "network", None, None, f"failed to fetch ledger {probe}"
+                probe_time = headers[probe][1]
+                logger.debug(
+                    "    ↳ %s iter %d (quartile): ledger=%s, close_time=%s, diff=%.1fs",
+                    tag, iter_count, probe, probe_time, (probe_time - target_dt).total_seconds(),
+                )
+                # 時刻順に見て、最初に target_dt 以降になった点が新しい上限、その手前が下限
+                if probe_time >= target_dt:
+                    hi_index, hi_time = probe, probe_time
+                    break
+                lo_index, lo_time = probe, probe_time
+            continue
+
+        if use_interpolation:
+            frac = (target_dt - lo_time).total_seconds() / max((hi_time - lo_time).total_seconds(), 1)
+            frac = min(max(frac, INTERPOLATION_MARGIN), 1 - INTERPOLATION_MARGIN)
+            mid = lo_index + int(frac * span)
+            mid = min(max(mid, lo_index + 1), hi_index - 1)
+        else:
+            mid = (lo_index + hi_index) // 2
+
+        mid_time = await get_ledger_time(mid)
         diff_mid = (mid_time - target_dt).total_seconds()
 
         iter_count += 1
-        print(f"    ↳ iter {iter_count}: ledger={mid}, close_time={mid_time}, diff={diff_mid:.1f}s")
+        mode = "interp" if use_interpolation else "bisect"
+        logger.debug(
+            "    ↳ %s iter %d (%s): ledger=%s, close_time=%s, diff=%.1fs",
+            tag, iter_count, mode, mid, mid_time, diff_mid,
+        )
 
         if mid_time >= target_dt:
             hi_index, hi_time = mid, mid_time
         else:
             lo_index, lo_time = mid, mid_time
 
-        time.sleep(0.05)
+        # target_dt の直後に当たったら、1つ前が target_dt より前かだけ確かめて探索を終える
+        if 0 <= diff_mid < SHORT_CIRCUIT_SECONDS and lo_index < mid - 1:
+            prev_time = await get_ledger_time(mid - 1)
+            if prev_time < target_dt:
+                lo_index, lo_time = mid - 1, prev_time
+                break
+            hi_index, hi_time = mid - 1, prev_time
+
+        if use_interpolation:
+            if hi_index - lo_index > span * 0.75:
+                misses += 1
+                if misses >= INTERPOLATION_MAX_MISSES:
+                    use_interpolation = False
+            else:
+                misses = 0
 
     # hi_index が「条件を満たす最小 index」
     if hi_time < target_dt:
@@ -125,152 +388,238 @@ def find_ledger_between(
 
     # 最終ログ
     final_diff = (hi_time - target_dt).total_seconds()
-    print(f"    ↳ result: ledger={hi_index}, close_time={hi_time}, diff={final_diff:.1f}s")
+    logger.debug("    ↳ %s result: ledger=%s, close_time=%s, diff=%.1fs", tag, hi_index, hi_time, final_diff)
 
-    return hi_index, hi_time
+    return "ok", hi_index, hi_time, ""
 
 
-def refine_hourly_for_range(key: str, dt_start: datetime, dt_end: datetime) -> None:
+async def find_ledger_via_clio(target_dt: datetime) -> tuple[int, datetime] | None:
+    """
+    Clio の ledger_index で target_dt 付近のレジャーを1回で引き、
+    「close_time >= target_dt を満たす最小の ledger_index」になるよう隣の1本で確かめる。
+    Clio がデータを持っていない・確認が合わない・通信エラー（NETWORK_ERRORS）のときは
+    None（呼び出し側で二分探索する）。
+    """
+    tag = target_dt.strftime("%H:%M")
+    date_str = target_dt.isoformat().replace("+00:00", "Z")
+    try:
+        res = await rpc_request(clio_client, GenericRequest(method="ledger_index", date=date_str))
+        if not res.is_successful():
+            logger.debug("    ↳ %s clio: %s → 二分探索にフォールバック", tag, res.result.get("error", "error"))
+            return None
+
+        idx = int(res.result["ledger_index"])
+        close_time = await get_ledger_time(idx)
+
+        if close_time >= target_dt:
+            # idx が条件を満たす → 1つ前が target_dt より前なら idx が最小
+            if await get_ledger_time(idx - 1) < target_dt:
+                return idx, close_time
+        else:
+            # idx は target_dt より前（直前のレジャー）→ 次のレジャーが答え
+            next_time = await get_ledger_time(idx + 1)
+            if next_time >= target_dt:
+                return idx + 1, next_time
+    except NETWORK_ERRORS as e:
+        # Clio が落ちていても、rippled の二分探索で続けられるようにする
+        logger.debug("    ↳ %s clio: %s: %s → 二分探索にフォールバック", tag, type(e).__name__, e)
+        return None
+
+    logger.debug("    ↳ %s clio: ledger=%s の前後が条件に合わない → 二分探索にフォールバック", tag, idx)
+    return None
+
+
+async def refine_hour(
+    target_dt: datetime,
+    lo_index: int,
+    hi_index: int,
+    latest: tuple[int, datetime],
+    use_clio: bool,
+) -> SearchResult:
+    """
+    1時間分の hourly を探す（use_clio なら Clio を先に試す）。
+    通信エラーは待ち時間を倍にしながら NETWORK_MAX_RETRIES 回までやり直す
+    """
+    for attempt in range(NETWORK_MAX_RETRIES + 1):
+        try:
+            found = await find_ledger_via_clio(target_dt) if use_clio else None
+            if found is not None:
+                return "ok", found[0], found[1], ""
+            result = await find_ledger_between(target_dt, lo_index, hi_index, latest)
+        except NETWORK_ERRORS as e:
+            result = "network", None, None, f"{type(e).__name__}: {e}"
+        if result[0] != "network" or attempt == NETWORK_MAX_RETRIES:
+            return result
+        wait = NETWORK_RETRY_BACKOFF * 2 ** attempt
+        logger.debug("    ↳ %s 通信エラー（%s）→ %.0f 秒後にやり直し", target_dt.strftime("%H:%M"), result[3], wait)
+        await asyncio.sleep(wait)
+    return result
+
+
+def refine_hourly_for_range(
+    key: str,
+    dt_start: datetime,
+    dt_end: datetime,
+    use_clio: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+) -> None:
     """
     R2上の key で指定された JSON キャッシュに対して、
     [dt_start, dt_end] の 1時間ごとのエントリを hourly に追加（なければ）する。
 
-    - daily のラフデータをアンカーとし、「前日の daily」と「翌日の daily」の
-      ledger_index を探索の基本下限・上限にする
-    - さらに、直前の hourly の ledger_index を下限に取り込むことで検索範囲を狭める
+    - daily のラフデータをアンカーとし、「前日の daily」と「翌日の daily」
+      （抜けていればその前後で一番近いもの）の ledger_index を探索の基本下限・上限にする
+    - さらに、直前の既存 hourly（前日までに確定したものを含む。補間値は除く）の ledger_index を
+      下限に取り込むことで検索範囲を狭める
+    - 1日分の不足時間は同時に探索する（同じ日の結果どうしで範囲は狭めない）
     - 精緻条件は「target_dt と同時刻のレジャー」か「その直後の最初のレジャー」に限定
-    - 変更があった場合のみ、最後に1回保存
+    - 最新 validated レジャーより先の時間は処理しない（dt_end を実行開始時点の最新時刻で切り詰める）
+    - checkpoint_every 本追加するごとに保存し、最後に残りを保存（変更がなければ保存しない）
+    - use_clio=True なら各時間をまず Clio の ledger_index で引く（find_ledger_via_clio）
     """
+    asyncio.run(_refine_hourly_for_range(key, dt_start, dt_end, use_clio, checkpoint_every))
+
+
+async def _refine_hourly_for_range(
+    key: str,
+    dt_start: datetime,
+    dt_end: datetime,
+    use_clio: bool,
+    checkpoint_every: int,
+) -> None:
+    _rpc_semaphore.set(asyncio.Semaphore(REFINE_CONCURRENCY))
+    load_ledger_time_db()
+
     cache = load_cache(key)
-    daily: dict = cache.setdefault("daily", {})
-    hourly: dict = cache.setdefault("hourly", {})
+    daily, hourly = load_entries(cache)
+    daily_dates, daily_indices = split_daily(daily)
+
+    # 最新 validated レジャーより先の時間はまだ探せないので、終わりをその時刻（時単位に切り捨て）までにする
+    _, latest_time = await get_latest_ledger()
+    effective_end = min(dt_end, latest_time.replace(minute=0, second=0, microsecond=0))
+    if effective_end < dt_end:
+        print(f"最新 validated レジャー（{latest_time}）より先は対象外: {effective_end} までを処理します")
+        dt_end = effective_end
 
-    cur = dt_start
     total_hours = int(((dt_end - dt_start).total_seconds() // 3600) + 1)
+    first_date = dt_start.date()
+    total_days = (dt_end.date() - first_date).days + 1
     processed = 0
     added = 0
-
-    prev_date = None
+    unsaved = 0  # まだ R2 に保存していない追加件数
 
     print(f"{dt_start} ～ {dt_end} の hourly を {key} に追記します。")
 
-    # 1日ごとに「その日の daily ベースの lo_index / hi_index」
-    day_lo_index = None
-    day_hi_index = None
-
     # 直近で確定している hourly の ledger_index（前日も含めてグローバルに単調増加）
     last_hourly_index = None
 
-    while cur <= dt_end:
-        processed += 1
-        current_date = cur.date()
-        date_key = current_date.strftime("%Y-%m-%d")
-
-        # 日付が変わったら daily を元に探索範囲を更新
-        if prev_date is None or current_date != prev_date:
-            today_entry = daily.get(date_key)
-            if not today_entry:
-                print(f"{date_key}: daily アンカーなし → この日の hourly を全スキップ")
-                # 次の日の 0:00 に飛ばす
-                cur = datetime.combine(
-                    current_date + timedelta(days=1),
-                    datetime.min.time(),
-                    tzinfo=timezone.utc,
-                )
-                prev_date = current_date
-                day_lo_index = None
-                day_hi_index = None
+    try:
+        for day_offset in range(total_days):
+            current_date = first_date + timedelta(days=day_offset)
+            day_start = datetime(current_date.year, current_date.month, current_date.day, tzinfo=timezone.utc)
+            date_key = date_key_of(current_date)
+            # hourly のキー: 2025-12-01T00:00:00Z 形式
+            key_iso_prefix = f"{date_key}T"
+
+            # この日の対象時間（範囲の最初と最後の日は一部だけ）
+            first_hour = dt_start.hour if current_date == first_date else 0
+            last_hour = dt_end.hour if current_date == dt_end.date() else 23
+            day_hours = range(first_hour, last_hour + 1)
+
+            # daily を元に探索範囲を決める
+            pos = bisect_left(daily_dates, current_date)
+            if pos == len(daily_dates) or daily_dates[pos] != current_date:
+                processed += len(day_hours)
+                logger.warning("%s: daily アンカーなし → この日の hourly を全スキップ", date_key)
                 continue
 
-            # 前日の daily
-            prev_date_obj = current_date - timedelta(days=1)
-            prev_key = prev_date_obj.strftime("%Y-%m-%d")
-            prev_entry = daily.get(prev_key)
-
-            # 翌日の daily
-            next_date_obj = current_date + timedelta(days=1)
-            next_key = next_date_obj.strftime("%Y-%m-%d")
-            next_entry = daily.get(next_key)
+            # 前後で一番近い daily（ふつうは前日・翌日。抜けている日があればさらに前・後）
+            has_prev = pos > 0
+            has_next = pos + 1 < len(daily_dates)
 
-            if prev_entry:
-                day_lo_index = int(prev_entry["ledger_index"])
+            if has_prev:
+                day_lo_index = daily_indices[pos - 1]
             else:
                 day_lo_index = GENESIS_INDEX
 
-            if next_entry:
-                day_hi_index = int(next_entry["ledger_index"])
+            if has_next:
+                day_hi_index = daily_indices[pos + 1]
             else:
-                # 翌日 daily がなければ、とりあえず「今日の daily より十分先」
+                # 後ろに daily がなければ、とりあえず「今日の daily より十分先」
                 # 実際には find_ledger_between 側で validated を上限にクランプされる
-                day_hi_index = int(today_entry["ledger_index"]) + 200_000
+                day_hi_index = daily_indices[pos] + 200_000
 
-            print(
-                f"{date_key}: base探索範囲 lo={day_lo_index}, hi={day_hi_index} "
-                f"(prev_daily={prev_key if prev_entry else 'GENESIS'}, "
-                f"next_daily={next_key if next_entry else 'validated付近'})"
+            logger.debug(
+                "%s: base探索範囲 lo=%s, hi=%s (prev_daily=%s, next_daily=%s)",
+                date_key, day_lo_index, day_hi_index,
+                daily_dates[pos - 1] if has_prev else "GENESIS",
+                daily_dates[pos + 1] if has_next else "validated付近",
             )
 
-            prev_date = current_date
-
-        # hourly のキー: 2025-12-01T00:00:00Z 形式
-        key_iso = cur.replace(minute=0, second=0, microsecond=0).isoformat().replace("+00:00", "Z")
-
-        # すでに hourly が存在する場合は、それを last_hourly として活用してスキップ
-        if key_iso in hourly:
-            existing = hourly[key_iso]
-            try:
-                existing_idx = int(existing.get("ledger_index"))
-                if last_hourly_index is None or existing_idx > last_hourly_index:
-                    last_hourly_index = existing_idx
-            except Exception:
-                pass
-
-            print(f"[{processed}/{total_hours}] {key_iso}: hourly 既存 → スキップ")
-            cur += timedelta(hours=1)
-            continue
-
-        if day_lo_index is None or day_hi_index is None:
-            print(f"[{processed}/{total_hours}] {key_iso}: 探索範囲が未設定 → スキップ")
-            cur += timedelta(hours=1)
-            continue
-
-        target_dt = cur
-
-        # 直前の hourly を考慮して下限を狭める
-        lo_index = day_lo_index
-        if last_hourly_index is not None and last_hourly_index > lo_index:
-            lo_index = last_hourly_index
-
-        hi_index = day_hi_index
-
-        print(f"[{processed}/{total_hours}] {key_iso}: {lo_index}～{hi_index} で探索")
+            # 既存の hourly は last_hourly として活用してスキップし、不足分だけ探索範囲を決める
+            pending = []
+            for hour in day_hours:
+                processed += 1
+                key_iso = f"{key_iso_prefix}{hour:02d}:00:00Z"
+
+                existing = hourly.get(key_iso)
+                if existing is not None and existing.interpolated:
+                    # 補間で埋めた推定値は確定扱いにせず、探索し直して上書きする
+                    logger.debug("[%d/%d] %s: hourly 補間値 → 探索し直す", processed, total_hours, key_iso)
+                elif existing is not None:
+                    if last_hourly_index is None or existing.ledger_index > last_hourly_index:
+                        last_hourly_index = existing.ledger_index
+
+                    logger.debug("[%d/%d] %s: hourly 既存 → スキップ", processed, total_hours, key_iso)
+                    continue
+
+                # 直前の hourly を考慮して下限を狭める
+                lo_index = day_lo_index
+                if last_hourly_index is not None and last_hourly_index > lo_index:
+                    lo_index = last_hourly_index
+
+                logger.debug("[%d/%d] %s: %s～%s で探索", processed, total_hours, key_iso, lo_index, day_hi_index)
+                pending.append((key_iso, day_start + timedelta(hours=hour), lo_index))
+
+            latest = await get_latest_ledger() if pending else None
+            results = await asyncio.gather(
+                *(refine_hour(target_dt, lo_index, day_hi_index, latest, use_clio) for _, target_dt, lo_index in pending)
+            )
 
-        try:
-            idx, close_time = find_ledger_between(target_dt, lo_index, hi_index)
-            hourly[key_iso] = {
-                "ledger_index": idx,
-                "close_time": close_time.isoformat().replace("+00:00", "Z"),
-            }
-            added += 1
-            last_hourly_index = idx  # 直前 hourly として更新
-            print(f"   ↳ hourly 追加: ledger={idx}, close_time={close_time}")
-            time.sleep(0.3)
-        except FutureLedgerError as e:
-            print(f"   ⏭ 未来の時間帯のためスキップ: {e}")
-            break
-        except Exception as e:
-            # 条件を満たせなかった／その他エラー → hourly は書かず次へ
-            print(f"   ⚠ hourly 取得失敗: {e}")
-            time.sleep(0.5)
-
-        cur += timedelta(hours=1)
+            # 結果は時刻順に反映する
+            for (key_iso, _, _), result in zip(pending, results):
+                match result:
+                    case ("ok", idx, close_time, _):
+                        pass
+                    case (kind, _, _, message):
+                        # 範囲外／通信エラー → hourly は書かず次へ
+                        logger.warning("   ⚠ %s: hourly 取得失敗 (%s): %s", key_iso, kind, message)
+                        continue
+
+                hourly[key_iso] = HourlyEntry(idx, close_time.isoformat().replace("+00:00", "Z"))
+                added += 1
+                unsaved += 1
+                if last_hourly_index is None or idx > last_hourly_index:
+                    last_hourly_index = idx  # 翌日以降の下限に使う
+                logger.info("   ↳ %s: hourly 追加: ledger=%s, close_time=%s", key_iso, idx, close_time)
+
+            flush_ledger_time_db()
+
+            if unsaved >= checkpoint_every:
+                print(f"{date_key} までの {unsaved} 件を保存（チェックポイント）")
+                save_hourly(key, cache, hourly)
+                unsaved = 0
+    finally:
+        # 中断（Ctrl+C やエラー）された場合も、取得済みの分は保存しておく
+        if unsaved > 0:
+            save_hourly(key, cache, hourly)
+        # このループ用に張った接続を閉じる
+        await async_client.aclose()
+        await clio_client.aclose()
 
     print(f"\n✅ hourly 精緻化完了: {processed} 時間中 {added} 本を追加")
-    
-    # 変更があった場合のみ保存
-    if added > 0:
-        save_cache(key, cache)
-    else:
+
+    if added == 0:
         print("変更なしのため保存スキップ")
 
 
@@ -278,22 +627,58 @@ def parse_date(s: str) -> datetime:
     return datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc)
 
 
+def main(argv: list[str]) -> int:
+    """コマンドライン引数（プログラム名を除く）を受け取って実行する。戻り値は終了コード"""
+    parser = argparse.ArgumentParser(
+        description="daily をアンカーに hourly を二分探索で精緻化し、R2 に保存する",
+        epilog=(
+            "例:\n"
+            "  python refine_hourly_ledger_cache3.py ledger_cache_2025.json 2025-01-01 2025-12-31\n"
+            "\n"
+            "環境変数:\n"
+            "  R2_ACCOUNT_ID       - CloudflareアカウントID\n"
+            "  R2_ACCESS_KEY_ID    - R2のアクセスキーID\n"
+            "  R2_SECRET_ACCESS_KEY - R2のシークレットアクセスキー\n"
+            "  R2_BUCKET_NAME      - バケット名"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("r2_key", help="R2 上のオブジェクトキー")
+    parser.add_argument("start_date", help="開始日 (YYYY-MM-DD)")
+    parser.add_argument("end_date", help="終了日 (YYYY-MM-DD)")
+    parser.add_argument(
+        "--use-clio",
+        action="store_true",
+        help=f"各時間をまず Clio の ledger_index で直接引く（{CLIO_URL}、合わなければ二分探索）",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=DEFAULT_CHECKPOINT_EVERY,
+        metavar="N",
+        help=f"N 本追加するごとに R2 に保存する（既定: {DEFAULT_CHECKPOINT_EVERY}）",
+    )
+    args = parser.parse_args(argv)
+
+    # update_ledger_cache.py から呼ばれたときも出力を拾えるよう、その時点の sys.stdout に出す
+    logging.basicConfig(
+        level=os.environ.get("LOGLEVEL", "INFO").upper(),
+        format="%(message)s",
+        stream=sys.stdout,
+    )
+
+    start_dt = parse_date(args.start_date)
+    end_dt = parse_date(args.end_date)
+
+    refine_hourly_for_range(
+        args.r2_key,
+        start_dt,
+        end_dt,
+        use_clio=args.use_clio,
+        checkpoint_every=args.checkpoint_every,
+    )
+    return 0
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("使い方:")
-        print("  python refine_hourly_ledger_cache3.py <r2_key> <start_date> <end_date>")
-        print("例:")
-        print("  python refine_hourly_ledger_cache3.py ledger_cache_2025.json 2025-01-01 2025-12-31")
-        print()
-        print("環境変数:")
-        print("  R2_ACCOUNT_ID       - CloudflareアカウントID")
-        print("  R2_ACCESS_KEY_ID    - R2のアクセスキーID")
-        print("  R2_SECRET_ACCESS_KEY - R2のシークレットアクセスキー")
-        print("  R2_BUCKET_NAME      - バケット名")
-        sys.exit(1)
-
-    r2_key = sys.argv[1]
-    start_dt = parse_date(sys.argv[2])
-    end_dt = parse_date(sys.argv[3])
-
-    refine_hourly_for_range(r2_key, start_dt, end_dt)
+    sys.exit(main(sys.argv[1:]))
@@ -15,6 +15,10 @@ GitHub Actions から呼び出され、当年と前年の2年分のデータを
    - 前年: YYYY-01-01 ～ (YYYY+1)-01-01
    - 当年: YYYY-01-01 ～ (YYYY+1)-01-01
 
+オプション:
+  --use-clio: 精緻データの各時間を、まず Clio の ledger_index で直接引く
+              （refine_hourly_ledger_cache_r2.py にそのまま渡す）
+
 環境変数:
   R2_ACCOUNT_ID: CloudflareアカウントID
   R2_ACCESS_KEY_ID: R2のアクセスキーID
@@ -22,34 +26,107 @@ GitHub Actions から呼び出され、当年と前年の2年分のデータを
   R2_BUCKET_NAME: バケット名
 """
 
-import subprocess
+import argparse
+import io
 import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 
+import append_rough_ledger_cache_r2
+import refine_hourly_ledger_cache_r2
+
 
 def get_current_year() -> int:
     """現在のUTC年を取得"""
     return datetime.now(timezone.utc).year
 
 
-def run_command(args: list[str]) -> bool:
-    """コマンドを実行し、成功したかどうかを返す"""
-    print(f"\n{'='*60}")
-    print(f"実行: {' '.join(args)}")
-    print('='*60)
-    
+class ThreadLocalStdout:
+    """
+    スレッドごとに出力先を切り替えられる sys.stdout の代わり。
+    同じプロセス内で並列に走らせた処理の print を、それぞれ別のバッファに集める。
+    """
+
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def redirect(self, stream) -> None:
+        """このスレッドの出力先を stream にする（None なら元の stdout に戻す）"""
+        self._local.stream = stream
+
+    def _target(self):
+        return getattr(self._local, "stream", None) or self._default
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+
+def run_job(label: str, module, argv: list[str]) -> tuple[bool, str]:
+    """
+    module.main(argv) を同じプロセス内で実行し、(成功したかどうか, 出力) を返す。
+    並列に走らせても混ざらないよう、出力は各行の先頭に [label] を付けてまとめて返す。
+    """
+    command = f"{module.__name__}.py {' '.join(argv)}"
+    buffer = io.StringIO()
+    sys.stdout.redirect(buffer)
     try:
-        result = subprocess.run(args, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"⚠ コマンド失敗 (exit code {e.returncode}): {' '.join(args)}")
-        return False
-    except Exception as e:
-        print(f"⚠ エラー: {e}")
-        return False
+        exit_code = module.main(argv)
+    except SystemExit as e:
+        exit_code = e.code
+    except Exception:
+        traceback.print_exc(file=buffer)
+        exit_code = "例外"
+    finally:
+        sys.stdout.redirect(None)
+
+    ok = exit_code in (0, None)
+    lines = [
+        f"\n{'='*60}",
+        f"[{label}] 実行: {command}",
+        '='*60,
+    ]
+    lines.extend(f"[{label}] {line}" for line in buffer.getvalue().splitlines())
+    if not ok:
+        lines.append(f"[{label}] ⚠ 処理失敗 (exit code {exit_code}): {command}")
+    return ok, "\n".join(lines)
+
+
+def run_jobs(jobs: list[tuple[str, object, list[str]]]) -> int:
+    """
+    互いに独立した処理（別の年・別の R2 キー）を同時に実行し、成功した数を返す。
+    別プロセスを立ち上げないので、XRPL / R2 のクライアントと接続は全フェーズで使い回される。
+    出力は終わったものから順に表示する。
+    """
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(run_job, label, module, argv) for label, module, argv in jobs]
+        for future in as_completed(futures):
+            ok, output = future.result()
+            print(output, flush=True)
+            if ok:
+                success_count += 1
+    return success_count
 
 
 def main():
+    parser = argparse.ArgumentParser(description="XRPL Ledger Cache を当年と前年の2年分更新する")
+    parser.add_argument(
+        "--use-clio",
+        action="store_true",
+        help="精緻データ（hourly）をまず Clio の ledger_index で引く",
+    )
+    args = parser.parse_args()
+    refine_options = ["--use-clio"] if args.use_clio else []
+
+    # 各処理の print をスレッドごとに振り分けられるようにする
+    sys.stdout = ThreadLocalStdout(sys.stdout)
+
     current_year = get_current_year()
     prev_year = current_year - 1
     next_year = current_year + 1
@@ -68,25 +145,21 @@ def main():
     print("# Phase 1: ラフデータ（daily）の追加")
     print('#'*60)
 
-    # 前年
-    total_count += 1
-    if run_command([
-        "python", "append_rough_ledger_cache_r2.py",
-        f"ledger_cache_{prev_year}.json",
-        f"{prev_year}-01-01",
-        f"{prev_year}-12-31"
-    ]):
-        success_count += 1
-
-    # 当年
-    total_count += 1
-    if run_command([
-        "python", "append_rough_ledger_cache_r2.py",
-        f"ledger_cache_{current_year}.json",
-        f"{current_year}-01-01",
-        f"{current_year}-12-31"
-    ]):
-        success_count += 1
+    # 前年・当年を同時に実行
+    jobs = [
+        (str(prev_year), append_rough_ledger_cache_r2, [
+            f"ledger_cache_{prev_year}.json",
+            f"{prev_year}-01-01",
+            f"{prev_year}-12-31",
+        ]),
+        (str(current_year), append_rough_ledger_cache_r2, [
+            f"ledger_cache_{current_year}.json",
+            f"{current_year}-01-01",
+            f"{current_year}-12-31",
+        ]),
+    ]
+    total_count += len(jobs)
+    success_count += run_jobs(jobs)
 
     # ========================================
     # 2. 精緻データ（hourly）の追加
@@ -95,25 +168,23 @@ def main():
     print("# Phase 2: 精緻データ（hourly）の追加")
     print('#'*60)
 
-    # 前年（翌年の1/1まで含める）
-    total_count += 1
-    if run_command([
-        "python", "refine_hourly_ledger_cache_r2.py",
-        f"ledger_cache_{prev_year}.json",
-        f"{prev_year}-01-01",
-        f"{current_year}-01-01"
-    ]):
-        success_count += 1
-
-    # 当年（翌年の1/1まで含める）
-    total_count += 1
-    if run_command([
-        "python", "refine_hourly_ledger_cache_r2.py",
-        f"ledger_cache_{current_year}.json",
-        f"{current_year}-01-01",
-        f"{next_year}-01-01"
-    ]):
-        success_count += 1
+    # 前年・当年を同時に実行（どちらも翌年の1/1まで含める）
+    jobs = [
+        (str(prev_year), refine_hourly_ledger_cache_r2, [
+            f"ledger_cache_{prev_year}.json",
+            f"{prev_year}-01-01",
+            f"{current_year}-01-01",
+            *refine_options,
+        ]),
+        (str(current_year), refine_hourly_ledger_cache_r2, [
+            f"ledger_cache_{current_year}.json",
+            f"{current_year}-01-01",
+            f"{next_year}-01-01",
+            *refine_options,
+        ]),
+    ]
+    total_count += len(jobs)
+    success_count += run_jobs(jobs)
 
     # ========================================
     # 結果サマリー
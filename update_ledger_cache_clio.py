@@ -20,6 +20,7 @@ Clio API を使用するため、従来の二分探索版と比べて：
 
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 
 
@@ -28,21 +29,43 @@ def get_current_year() -> int:
     return datetime.now(timezone.utc).year
 
 
-def run_command(args: list[str]) -> bool:
-    """コマンドを実行し、成功したかどうかを返す"""
-    print(f"\n{'='*60}")
-    print(f"実行: {' '.join(args)}")
-    print('='*60)
-    
+def run_command(label: str, args: list[str]) -> tuple[bool, str]:
+    """
+    コマンドを実行し、(成功したかどうか, 出力) を返す。
+    並列に走らせても混ざらないよう、出力は各行の先頭に [label] を付けてまとめて返す。
+    """
+    lines = [
+        f"\n{'='*60}",
+        f"[{label}] 実行: {' '.join(args)}",
+        '='*60,
+    ]
+
     try:
-        result = subprocess.run(args, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"⚠ コマンド失敗 (exit code {e.returncode}): {' '.join(args)}")
-        return False
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     except Exception as e:
-        print(f"⚠ エラー: {e}")
-        return False
+        lines.append(f"[{label}] ⚠ エラー: {e}")
+        return False, "\n".join(lines)
+
+    lines.extend(f"[{label}] {line}" for line in result.stdout.splitlines())
+    if result.returncode != 0:
+        lines.append(f"[{label}] ⚠ コマンド失敗 (exit code {result.returncode}): {' '.join(args)}")
+    return result.returncode == 0, "\n".join(lines)
+
+
+def run_commands(jobs: list[tuple[str, list[str]]]) -> int:
+    """
+    互いに独立したコマンド（別の年・別の R2 キー）を同時に実行し、成功した数を返す。
+    出力は終わったものから順に表示する。
+    """
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(run_command, label, args) for label, args in jobs]
+        for future in as_completed(futures):
+            ok, output = future.result()
+            print(output, flush=True)
+            if ok:
+                success_count += 1
+    return success_count
 
 
 def main():
@@ -57,28 +80,24 @@ def main():
     total_count = 0
 
     # ========================================
-    # 前年の hourly 生成
-    # ========================================
-    total_count += 1
-    if run_command([
-        "python", "generate_hourly_clio.py",
-        f"ledger_cache_{prev_year}.json",
-        f"{prev_year}-01-01",
-        f"{prev_year}-12-31"
-    ]):
-        success_count += 1
-
-    # ========================================
-    # 当年の hourly 生成
+    # 前年・当年の hourly 生成（同時に実行）
     # ========================================
-    total_count += 1
-    if run_command([
-        "python", "generate_hourly_clio.py",
-        f"ledger_cache_{current_year}.json",
-        f"{current_year}-01-01",
-        f"{current_year}-12-31"
-    ]):
-        success_count += 1
+    jobs = [
+        (str(prev_year), [
+            "python", "generate_hourly_clio.py",
+            f"ledger_cache_{prev_year}.json",
+            f"{prev_year}-01-01",
+            f"{prev_year}-12-31"
+        ]),
+        (str(current_year), [
+            "python", "generate_hourly_clio.py",
+            f"ledger_cache_{current_year}.json",
+            f"{current_year}-01-01",
+            f"{current_year}-12-31"
+        ]),
+    ]
+    total_count += len(jobs)
+    success_count += run_commands(jobs)
 
     # ========================================
     # 結果サマリー